@@ -1,3 +1,5 @@
+import argparse
+import os
 import time
 import pygame
 import random
@@ -6,6 +8,16 @@ import math
 from source import boid
 from source import ui
 from source import bvh
+from source import obstacles
+from source import field
+from source import snapshot
+from source import recorder
+from source import feed
+from source import telemetry
+from source import flocking
+from source import domain
+from source import camera
+from source import tuner
 
 import colorsys
 
@@ -13,6 +25,83 @@ import colorsys
 # setup
 # ------------------------------------------------------------------------ #
 
+# command line
+W_ARGS_PARSER = argparse.ArgumentParser(description="boids simulation with a bvh")
+W_ARGS_PARSER.add_argument(
+    "--checkpoint",
+    default="checkpoint.boids",
+    help="snapshot file written with F5 and loaded with F9",
+)
+W_ARGS_PARSER.add_argument(
+    "--resume",
+    default=None,
+    help="start from this snapshot instead of random boids",
+)
+W_ARGS_PARSER.add_argument(
+    "--record",
+    default=None,
+    help="stream boid trajectories to this file (F6 toggles recording)",
+)
+W_ARGS_PARSER.add_argument(
+    "--record-every",
+    type=int,
+    default=1,
+    help="record every n-th frame",
+)
+W_ARGS_PARSER.add_argument(
+    "--seed",
+    type=int,
+    default=None,
+    help="seed for the simulation rng (random if not given)",
+)
+W_ARGS_PARSER.add_argument(
+    "--fixed-step",
+    action="store_true",
+    help="advance the simulation by exactly 1 / fps per frame",
+)
+W_ARGS_PARSER.add_argument(
+    "--headless",
+    action="store_true",
+    help="run without a window or rendering, as fast as possible",
+)
+W_ARGS_PARSER.add_argument(
+    "--frames",
+    type=int,
+    default=0,
+    help="stop after this many frames (0 = run until closed)",
+)
+W_ARGS_PARSER.add_argument(
+    "--feed",
+    default=None,
+    help="publish every frame to this shared memory feed (see source/feed.py)",
+)
+W_ARGS_PARSER.add_argument(
+    "--feed-capacity",
+    type=int,
+    default=5000,
+    help="most boids published per frame",
+)
+W_ARGS_PARSER.add_argument(
+    "--set",
+    action="append",
+    default=[],
+    metavar="KEY=VALUE",
+    help="override a boid logic constant, e.g. --set push_factor=2",
+)
+W_ARGS_PARSER.add_argument(
+    "--domains",
+    default=None,
+    metavar="COLSxROWS",
+    help="split the world over a grid of worker processes, e.g. 2x2",
+)
+W_ARGS_PARSER.add_argument(
+    "--telemetry",
+    type=int,
+    default=None,
+    help="serve control + state streaming on this localhost port",
+)
+W_ARGS = W_ARGS_PARSER.parse_args()
+
 # constants
 W_RUNNING = False
 W_SIZE = [1280, 720]
@@ -23,9 +112,6 @@ W_BIT_DEPTH = 32
 W_BACKGROUND_COLOR = (0, 17, 41, 255)
 W_CLOCK = pygame.time.Clock()
 
-W_BUF_SIZE = (W_SIZE[0] * 1.03, W_SIZE[1] * 1.03)
-W_BUF_POS = (-(W_BUF_SIZE[0] - W_SIZE[0]) // 2, -(W_BUF_SIZE[1] - W_SIZE[1]) // 2)
-
 W_GLOBAL_START = time.time()
 W_START = time.time()
 W_END = time.time()
@@ -33,8 +119,13 @@ W_DELTA = 1 / 60
 W_FPS = 60
 
 # surfaces
+if W_ARGS.headless:
+    # still needs a display for the ui fonts + surfaces, but never shows it
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
 W_WINDOW = pygame.display.set_mode(W_SIZE, W_FLAGS, W_BIT_DEPTH)
-W_FRAMEBUFFER = pygame.Surface(W_FB_SIZE).convert_alpha()
+# the world is drawn through the camera, straight at window size
+W_FRAMEBUFFER = pygame.Surface(W_SIZE).convert_alpha()
+W_CAMERA = camera.Camera(W_FB_SIZE, W_SIZE, zoom=1.03)
 
 
 # ------------------------------------------------------------------------ #
@@ -47,12 +138,21 @@ SIMULATION_SIZE = 400
 
 UP = pygame.Vector2(0, 1)
 INIT_SPEED_RANGE = [70, 150]
+# top of the min speed slider
+MIN_SPEED_MAX = 500
+# top of the detection radius slider
+DETECTION_RADIUS_MAX = 500
 
 BOID_TRIANGLE = [
     pygame.Vector2(0, 10),
     pygame.Vector2(-6, -6),
     pygame.Vector2(6, -6),
 ]
+# furthest the triangle reaches from the boid position
+BOID_SIZE = 10
+# zoomed out below this (1 = the whole world fits the window) boids are
+# drawn as points
+LOD_POINT_ZOOM = 0.75
 BOID_LOGIC_CONSTANTS = {
     "push_factor": 48,
     "steer_factor": 4.85,
@@ -68,52 +168,392 @@ BOID_LOGIC_CONSTANTS = {
     # for debugging
     "enable_vectors": False,
     "use_bvh": True,
+    "use_leaf_pairs": False,
+    "symmetric_pairs": False,
+    "use_aggregates": False,
+    "separation_radius": 40,
+    "use_barnes_hut": False,
+    "theta": 0.5,
+    "use_knn": False,
+    "knn_k": 7,
+    "enable_lookahead": False,
+    "lookahead_distance": 80,
+    "avoid_factor": 300,
+    "enable_obstacles": True,
+    "obstacle_radius": 40,
+    "obstacle_factor": 600,
+    "periodic_boundary": True,
+    # re-sort boid storage along the z-order curve every n frames
+    "morton_sort_interval": 30,
+    # let the tuner pick the bvh depth / brute force from frame timings
+    # (off for fixed step runs, they should reproduce exactly)
+    "auto_tune": not W_ARGS.fixed_step,
+    "enable_species": False,
+    "flee_radius": 120,
+    "flee_factor": 800,
+    "chase_radius": 250,
+    "chase_factor": 300,
+    "enable_field": True,
+    "field_factor": 400,
+    "field_source_radius": 300,
 }
 
-# create the boids container
-_boids_container = {}
+# species -- "constants" override BOID_LOGIC_CONSTANTS for that species,
+# "prey" / "predators" are bit masks of other species (1 << index)
+BOID_SPECIES = [
+    {
+        "name": "starling",
+        "weight": 0.6,
+        "hue": 0.55,
+        "constants": {},
+        "prey": 0,
+        "predators": 0b100,
+    },
+    {
+        "name": "swallow",
+        "weight": 0.37,
+        "hue": 0.3,
+        "constants": {
+            "steer_factor": 7,
+            "cohesion_factor": 90,
+            "distance_threshold": 90,
+        },
+        "prey": 0,
+        "predators": 0b100,
+    },
+    {
+        "name": "hawk",
+        "weight": 0.03,
+        "hue": 0.0,
+        "constants": {
+            "push_factor": 80,
+            "steer_factor": 1,
+            "cohesion_factor": 20,
+        },
+        "prey": 0b011,
+        "predators": 0,
+    },
+]
+# BOID_LOGIC_CONSTANTS merged with each species' overrides -- refreshed
+# every frame so the sliders still apply
+_species_constants = [BOID_LOGIC_CONSTANTS] * len(BOID_SPECIES)
+
+OBSTACLE_FILE = "obstacles.json"
+OBSTACLE_CACHE_DIR = ".cache"
+
+# create the boids container -- a flat list, see _boid_slots for lookups
+_boids_container = []
+# boid id -> index in _boids_container
+_boid_slots = {}
+# the boid tracked by the ui (drawn white + detection circle)
+_main_boid_id = None
+# population requested from the ui
+_target_population = SIMULATION_SIZE
+# trajectory recorder (None when not recording)
+_recorder = None
+# shared memory feed for external viewers
+_publisher = None
+# tcp control + streaming
+_telemetry = None
+# worker processes owning parts of the world (distributed mode)
+_domains = None
+# the workers need the boids again after a reset / spawn / load
+_scatter_pending = False
+_paused = False
+# frames since the boid storage was last re-sorted
+_morton_frame = 0
 _bounding_volume_hierarchy = bvh.BVHContainer2D(
     world_area=pygame.FRect(0, 0, W_FB_SIZE[0], W_FB_SIZE[1]),
     objects=[],
     max_depth=4,
 )
+_tuner = tuner.BroadphaseTuner(depth=_bounding_volume_hierarchy._max_depth)
+
+
+# static geometry -- built once, cached on disk
+_obstacle_layer = (
+    obstacles.ObstacleLayer.load(
+        OBSTACLE_FILE,
+        world_area=pygame.FRect(0, 0, W_FB_SIZE[0], W_FB_SIZE[1]),
+        max_depth=3,
+        cache_dir=OBSTACLE_CACHE_DIR,
+    )
+    if os.path.exists(OBSTACLE_FILE)
+    else None
+)
+
+
+# the simulation owns its rng, so a seed reproduces a run exactly
+W_SEED = (
+    W_ARGS.seed if W_ARGS.seed is not None else int.from_bytes(os.urandom(4), "little")
+)
+_rng = random.Random(W_SEED)
+
+
+def _randomize_boids(boids: list):
+    """
+    Give boids a random position + velocity -- one batched draw per
+    attribute for the whole list.
+    """
+    _count = len(boids)
+    _xs = _rng.choices(range(int(W_FB_SIZE[0]) + 1), k=_count)
+    _ys = _rng.choices(range(int(W_FB_SIZE[1]) + 1), k=_count)
+    _speeds = _rng.choices(
+        range(INIT_SPEED_RANGE[0], INIT_SPEED_RANGE[1] + 1), k=_count
+    )
+    _directions = [_rng.random() * 2 - 1 for i in range(2 * _count)]
+
+    for i, _boid in enumerate(boids):
+        _boid._position.xy = (_xs[i], _ys[i])
+        _boid._velocity.xy = (_directions[2 * i], _directions[2 * i + 1])
+        _boid._velocity *= _speeds[i]
+        _boid._acceleration.xy = (0, 0)
+
+
+# global steering -- attractors / repellers rasterized into a coarse grid
+_flow_field = field.FlowField(
+    pygame.FRect(0, 0, W_FB_SIZE[0], W_FB_SIZE[1]),
+    cell_size=48,
+)
+
+
+def _pick_species(count: int):
+    """
+    Pick `count` random species according to the species weights, in one
+    draw.
+    """
+    return _rng.choices(
+        range(len(BOID_SPECIES)),
+        weights=[_species["weight"] for _species in BOID_SPECIES],
+        k=count,
+    )
 
 
 def _create_world():
-    global _boids_container
+    global _boids_container, _main_boid_id, _scatter_pending
+    _scatter_pending = True
 
     if len(_boids_container) > 0:
         # just reset positions
-        for _boid in _boids_container.values():
-            _boid._position.xy = (
-                random.randint(0, W_FB_SIZE[0]),
-                random.randint(0, W_FB_SIZE[1]),
-            )
-            _boid._velocity.xy = (
-                random.random() * 2 - 1,
-                random.random() * 2 - 1,
-            )
-            _boid._velocity *= random.randint(INIT_SPEED_RANGE[0], INIT_SPEED_RANGE[1])
-            _boid._acceleration.xy = (0, 0)
+        _randomize_boids(_boids_container)
         return
 
     # create default boids
-    for i in range(SIMULATION_SIZE):
-        _boid = boid.Boid()
-        _boid._position.xy = (
-            random.randint(0, W_FB_SIZE[0]),
-            random.randint(0, W_FB_SIZE[1]),
-        )
-        _boid._velocity.xy = (
-            random.random() * 2 - 1,
-            random.random() * 2 - 1,
-        )
-        _boid._velocity *= random.randint(INIT_SPEED_RANGE[0], INIT_SPEED_RANGE[1])
-        _boid._acceleration.xy = (0, 0)
+    _new_boids = [boid.Boid() for i in range(SIMULATION_SIZE)]
+    _randomize_boids(_new_boids)
+    _species = _pick_species(SIMULATION_SIZE)
+    for i, _boid in enumerate(_new_boids):
+        _boid._species = _species[i] if i > 0 else 0
 
         # add to container
-        _boids_container[_boid._id] = _boid
-    _bounding_volume_hierarchy.update(list(_boids_container.values()))
+        _boid_slots[_boid._id] = len(_boids_container)
+        _boids_container.append(_boid)
+    _main_boid_id = _boids_container[0]._id
+    _bounding_volume_hierarchy.update(list(_boids_container))
+
+
+def spawn_boids(count: int):
+    """
+    Add `count` random boids while the simulation is running.
+
+    They are appended to the container and inserted straight into the BVH,
+    so they take part in this frame's queries without a rebuild.
+    """
+    _new_boids = [boid.Boid() for i in range(count)]
+    _randomize_boids(_new_boids)
+    _species = _pick_species(count)
+    for i, _boid in enumerate(_new_boids):
+        _boid._species = _species[i]
+
+        _boid_slots[_boid._id] = len(_boids_container)
+        _boids_container.append(_boid)
+        _bounding_volume_hierarchy.insert(_boid)
+
+
+def despawn_boids(count: int):
+    """
+    Remove up to `count` boids while the simulation is running.
+
+    Swap-remove from the container (the last boid fills the hole) and
+    remove from the BVH in place. The tracked main boid is never removed.
+    """
+    for i in range(count):
+        if len(_boids_container) <= 1:
+            return
+
+        # take from the end, but keep the main boid
+        _boid = _boids_container[-1]
+        if _boid._id == _main_boid_id:
+            _boid = _boids_container[-2]
+
+        # swap remove
+        _slot = _boid_slots.pop(_boid._id)
+        _last = _boids_container.pop()
+        if _last is not _boid:
+            _boids_container[_slot] = _last
+            _boid_slots[_last._id] = _slot
+
+        _bounding_volume_hierarchy.remove(_boid)
+
+
+def set_population(count: int):
+    """
+    Spawn or despawn boids until there are `count` of them.
+    """
+    global _scatter_pending
+    _scatter_pending = True
+
+    count = max(1, int(count))
+    if count > len(_boids_container):
+        spawn_boids(count - len(_boids_container))
+    elif count < len(_boids_container):
+        despawn_boids(len(_boids_container) - count)
+
+
+def save_checkpoint(path: str):
+    """
+    Write the current simulation state to a binary snapshot.
+    """
+    snapshot.write_snapshot(
+        path,
+        _boids_container,
+        metadata={
+            "constants": BOID_LOGIC_CONSTANTS,
+            "speed_range": INIT_SPEED_RANGE,
+            "seed": W_SEED,
+            # storage is re-sorted every n frames -- resume in the same phase
+            "morton_frame": _morton_frame,
+        },
+        rng_state=_rng.getstate(),
+        frame=_frame_total,
+        main_index=_boid_slots[_main_boid_id],
+    )
+    print(f"saved {len(_boids_container)} boids to {path}")
+
+
+def load_checkpoint(path: str):
+    """
+    Replace the simulation state with a snapshot (memory mapped, the boids
+    are filled straight from its arrays).
+    """
+    global _main_boid_id, _target_population, _scatter_pending
+    global _frame_total, _morton_frame
+
+    with snapshot.read_snapshot(path) as _snapshot:
+        _count = _snapshot._count
+
+        # reuse the boid objects we already have
+        while len(_boids_container) < _count:
+            _boids_container.append(boid.Boid())
+        del _boids_container[_count:]
+
+        _positions = _snapshot._positions
+        _velocities = _snapshot._velocities
+        _accelerations = _snapshot._accelerations
+        _species = _snapshot._species
+        for i, _boid in enumerate(_boids_container):
+            _boid._position.xy = (_positions[2 * i], _positions[2 * i + 1])
+            _boid._velocity.xy = (_velocities[2 * i], _velocities[2 * i + 1])
+            _boid._acceleration.xy = (
+                _accelerations[2 * i],
+                _accelerations[2 * i + 1],
+            )
+            _boid._species = _species[i]
+
+        BOID_LOGIC_CONSTANTS.update(_snapshot._metadata["constants"])
+        INIT_SPEED_RANGE[:] = _snapshot._metadata["speed_range"]
+        _rng.setstate(_snapshot._rng_state)
+        _main_index = _snapshot._main_index
+        _frame_total = _snapshot._frame
+        _morton_frame = _snapshot._metadata.get("morton_frame", 0)
+
+    _boid_slots.clear()
+    for i, _boid in enumerate(_boids_container):
+        _boid_slots[_boid._id] = i
+    _main_boid_id = _boids_container[_main_index]._id
+    _target_population = len(_boids_container)
+
+    # the same tree the saved frame ended with (see _handle_bvh)
+    if _morton_frame == 0:
+        _objects, _codes = bvh.sort_by_morton(
+            _boids_container, _bounding_volume_hierarchy._world_area
+        )
+        _bounding_volume_hierarchy.update(_objects, codes=_codes)
+    else:
+        _bounding_volume_hierarchy.update(list(_boids_container))
+    _scatter_pending = True
+    print(f"loaded {len(_boids_container)} boids from {path}")
+
+
+def start_recording(path: str):
+    """
+    Start streaming trajectories to `path` (background writer thread).
+    """
+    global _recorder
+    stop_recording()
+    _recorder = recorder.TrajectoryRecorder(
+        path,
+        every=W_ARGS.record_every,
+        metadata={
+            "world_size": list(W_FB_SIZE),
+            "every": W_ARGS.record_every,
+            "seed": W_SEED,
+            "fixed_step": W_ARGS.fixed_step,
+            "constants": BOID_LOGIC_CONSTANTS,
+        },
+    )
+    print(f"recording to {path}")
+
+
+def stop_recording():
+    """
+    Flush and close the running recorder, if any.
+    """
+    global _recorder
+    if _recorder is None:
+        return
+    _recorder.close()
+    if _recorder.get_dropped_frames() > 0:
+        print(f"recorder dropped {_recorder.get_dropped_frames()} frames")
+    _recorder = None
+
+
+def apply_command(command: dict):
+    """
+    Apply a control command from a telemetry client.
+    """
+    global _paused, _target_population
+
+    cmd = command["cmd"]
+    if cmd == "set":
+        # toggles stay booleans, everything else is a float (an int default
+        # doesn't mean the constant can't take fractions)
+        _key = command["key"]
+        if isinstance(BOID_LOGIC_CONSTANTS[_key], bool):
+            BOID_LOGIC_CONSTANTS[_key] = bool(command["value"])
+        else:
+            BOID_LOGIC_CONSTANTS[_key] = float(command["value"])
+        # choosing the broadphase by hand switches the tuner off
+        if _key == "use_bvh":
+            BOID_LOGIC_CONSTANTS["auto_tune"] = False
+            _auto_tune_button._value = False
+        # the domain workers only exchange halos so far
+        if _key == "distance_threshold" and _domains is not None:
+            BOID_LOGIC_CONSTANTS[_key] = min(
+                BOID_LOGIC_CONSTANTS[_key], _domains.get_max_threshold()
+            )
+    elif cmd == "pause":
+        _paused = True
+    elif cmd == "resume":
+        _paused = False
+    elif cmd == "reset":
+        _create_world()
+    elif cmd == "spawn":
+        _target_population = len(_boids_container) + int(command.get("count", 100))
+    elif cmd == "despawn":
+        _target_population = max(
+            1, len(_boids_container) - int(command.get("count", 100))
+        )
 
 
 # ------------------------------------------------------------------------ #
@@ -121,39 +561,108 @@ def _create_world():
 # ------------------------------------------------------------------------ #
 
 
+def _minimum_image(displacement):
+    """
+    Shortest displacement across the wrapped world edges.
+    """
+    return bvh.minimum_image(displacement, W_FB_SIZE)
+
+
+def _displacement_to(boid, other, periodic: bool):
+    """
+    Displacement from `boid` to `other` -- the shortest one across the
+    wrapped edges in a periodic world.
+    """
+    _displacement = other._position - boid._position
+    if periodic:
+        return _minimum_image(_displacement)
+    return _displacement
+
+
+def _boid_constants(boid):
+    """
+    Flocking constants for a boid -- its species' if species are enabled.
+    """
+    if BOID_LOGIC_CONSTANTS["enable_species"] == 1:
+        return _species_constants[boid._species]
+    return BOID_LOGIC_CONSTANTS
+
+
+def _flock_mask(boid):
+    """
+    BVH species mask of the boids this boid flocks with (None = everyone).
+    """
+    if BOID_LOGIC_CONSTANTS["enable_species"] == 1:
+        return 1 << boid._species
+    return None
+
+
 def iterate_nearby_boids(bvh, boids, boid):
     """
     Iterate through the nearby boids in the BVH.
     """
+    _threshold = _boid_constants(boid)["distance_threshold"]
+    _mask = _flock_mask(boid)
+
+    if BOID_LOGIC_CONSTANTS["periodic_boundary"] == 1:
+        for _other_boid, _ in bvh.query_periodic(
+            boid._position, _threshold, exclude=boid, mask=_mask
+        ):
+            yield _other_boid
+        return
+
     _nodes = bvh.get_colliding_nodes(
         pygame.FRect(
-            boid._position.x - BOID_LOGIC_CONSTANTS["distance_threshold"],
-            boid._position.y - BOID_LOGIC_CONSTANTS["distance_threshold"],
-            BOID_LOGIC_CONSTANTS["distance_threshold"] * 2,
-            BOID_LOGIC_CONSTANTS["distance_threshold"] * 2,
-        )
+            boid._position.x - _threshold,
+            boid._position.y - _threshold,
+            _threshold * 2,
+            _threshold * 2,
+        ),
+        mask=_mask,
     )
 
     for node in _nodes:
         for _other_boid in node._objects:
             # check if the boid is not the same as the other boid
-            if boid._id != _other_boid._id:
-                yield _other_boid
+            if boid is not _other_boid:
+                if _mask is None or _other_boid._species == boid._species:
+                    yield _other_boid
 
 
 def iterate_nearby_boids_no_bvh(bvh, boids, boid):
     """
     Iterate through the nearby boids in the BVH.
     """
-    for _other_boid in boids.values():
+    _threshold = _boid_constants(boid)["distance_threshold"]
+    _mask = _flock_mask(boid)
+
+    for _other_boid in boids:
         # check if the boid is not the same as the other boid
-        if boid._id != _other_boid._id:
+        if boid is not _other_boid:
+            if _mask is not None and _other_boid._species != boid._species:
+                continue
             _displacement = _other_boid._position - boid._position
-            if _displacement.length() < BOID_LOGIC_CONSTANTS["distance_threshold"]:
+            if BOID_LOGIC_CONSTANTS["periodic_boundary"] == 1:
+                _displacement = _minimum_image(_displacement)
+            if _displacement.length() < _threshold:
                 yield _other_boid
 
 
-def boid_logic(boid: boid.Boid, boids: dict, bvh: bvh.BVHContainer2D):
+def iterate_nearest_boids(bvh, boids, boid):
+    """
+    Iterate through the k nearest boids in the BVH.
+    """
+    yield from bvh.query_knn(
+        boid._position,
+        int(BOID_LOGIC_CONSTANTS["knn_k"]),
+        _boid_constants(boid)["distance_threshold"],
+        exclude=boid,
+        mask=_flock_mask(boid),
+        periodic=BOID_LOGIC_CONSTANTS["periodic_boundary"] == 1,
+    )
+
+
+def boid_logic(boid: boid.Boid, boids: list, bvh: bvh.BVHContainer2D):
     """
 
     This function only changes 1 things:
@@ -169,72 +678,348 @@ def boid_logic(boid: boid.Boid, boids: dict, bvh: bvh.BVHContainer2D):
     3. Cohesion: steer to move toward the average position of local flockmates
     """
 
-    # factors
-    _steer_factor = boid._velocity.copy()
-    _push_factor = pygame.Vector2(0, 0)
-    _cohesion_factor = pygame.Vector2(0, 0)
-    _nearby_boids = 0
-
     _iter_func = (
         iterate_nearby_boids
         if BOID_LOGIC_CONSTANTS["use_bvh"] == 1
         else iterate_nearby_boids_no_bvh
     )
+    if BOID_LOGIC_CONSTANTS["use_bvh"] == 1 and BOID_LOGIC_CONSTANTS["use_knn"] == 1:
+        _iter_func = iterate_nearest_boids
+
+    _apply_flocking(boid, *_accumulate_neighbors(boid, _iter_func(bvh, boids, boid)))
+
+
+def _accumulate_neighbors(boid: boid.Boid, neighbors):
+    """
+    Sum up the separation, alignment and cohesion contributions of `neighbors`.
+
+    Returns (push, steer, cohesion, count).
+    """
+    return flocking.accumulate_neighbors(
+        boid,
+        neighbors,
+        W_FB_SIZE if BOID_LOGIC_CONSTANTS["periodic_boundary"] == 1 else None,
+    )
+
+
+def _apply_flocking(
+    boid: boid.Boid,
+    push_factor: pygame.Vector2,
+    steer_factor: pygame.Vector2,
+    cohesion_factor: pygame.Vector2,
+    nearby_boids: int,
+):
+    """
+    Turn the accumulated neighbor sums into the boid's acceleration.
+    """
+    flocking.apply_flocking(
+        boid,
+        push_factor,
+        steer_factor,
+        cohesion_factor,
+        nearby_boids,
+        _boid_constants(boid),
+    )
+
+
+def flock_leaf_pairs(boids: list, bvh: bvh.BVHContainer2D):
+    """
+    Run the flocking interaction leaf by leaf.
 
-    for _other_boid in _iter_func(bvh, boids, boid):
-        _displacement = _other_boid._position - boid._position
+    The leaf-to-leaf interaction lists are computed once per frame with a
+    dual-tree traversal, so every boid in a leaf shares the same candidate
+    list instead of walking the BVH on its own.
+    """
+    _threshold = BOID_LOGIC_CONSTANTS["distance_threshold"]
+    _periodic = BOID_LOGIC_CONSTANTS["periodic_boundary"] == 1
+    bvh.compute_interaction_lists(_threshold, periodic=_periodic)
+
+    for leaf in bvh.get_leaves():
+        if leaf._object_count == 0:
+            continue
+
+        # gather candidates once for the whole leaf
+        _candidates = [
+            _other_boid
+            for _other_leaf in leaf._interaction_list
+            for _other_boid in _other_leaf._objects
+        ]
+
+        for _boid in leaf._objects:
+            _neighbors = (
+                _other_boid
+                for _other_boid in _candidates
+                if _other_boid is not _boid
+                and _displacement_to(_boid, _other_boid, _periodic).length()
+                < _threshold
+            )
+            _apply_flocking(_boid, *_accumulate_neighbors(_boid, _neighbors))
+
+
+def flock_symmetric_pairs(boids: list, bvh: bvh.BVHContainer2D):
+    """
+    Run the flocking interaction once per unordered pair of boids.
+
+    Separation, alignment and cohesion are all reciprocal, so each pair's
+    displacement is computed once and written into both boids' sums (the push
+    goes in opposite directions).
+    """
+    _threshold = BOID_LOGIC_CONSTANTS["distance_threshold"]
+    _periodic = BOID_LOGIC_CONSTANTS["periodic_boundary"] == 1
+    _pairs = bvh.compute_interaction_lists(_threshold, periodic=_periodic)
+
+    # per boid sums -- [push, steer, cohesion, count]
+    _sums = {}
+    for leaf in bvh.get_leaves():
+        for _boid in leaf._objects:
+            _sums[_boid._id] = [
+                pygame.Vector2(0, 0),
+                _boid._velocity.copy(),
+                pygame.Vector2(0, 0),
+                0,
+            ]
+
+    def _interact(_boid, _other_boid):
+        _displacement = _displacement_to(_boid, _other_boid, _periodic)
         _displacement_length = _displacement.length()
+        if _displacement_length >= _threshold:
+            return
 
-        # push factor - avoid others
+        _a = _sums[_boid._id]
+        _b = _sums[_other_boid._id]
+
+        # push factor - equal and opposite
         if _displacement_length > 0:
-            _push_factor += _displacement / _displacement_length**2 * 10
-        # steer factor - follow others directions
-        _steer_factor += _other_boid._velocity
-        # cohesion factor - average of neighbors
-        _cohesion_factor += _other_boid._position
-
-        _nearby_boids += 1
-    if _nearby_boids == 0:
-        return
+            _push = _displacement / _displacement_length**2 * 10
+            _a[0] += _push
+            _b[0] -= _push
+        # steer factor
+        _a[1] += _other_boid._velocity
+        _b[1] += _boid._velocity
+        # cohesion factor -- each sees the other's image next to it
+        if _periodic:
+            _a[2] += _boid._position + _displacement
+            _b[2] += _other_boid._position - _displacement
+        else:
+            _a[2] += _other_boid._position
+            _b[2] += _boid._position
+
+        _a[3] += 1
+        _b[3] += 1
+
+    for leaf_a, leaf_b in _pairs:
+        if leaf_a is leaf_b:
+            _objects = leaf_a._objects
+            for i, _boid in enumerate(_objects):
+                for _other_boid in _objects[i + 1 :]:
+                    _interact(_boid, _other_boid)
+        else:
+            for _boid in leaf_a._objects:
+                for _other_boid in leaf_b._objects:
+                    _interact(_boid, _other_boid)
 
-    # step 1: calculate push factor
-    if _push_factor.length() > 0:
-        _push_factor *= -1
+    for leaf in bvh.get_leaves():
+        for _boid in leaf._objects:
+            _apply_flocking(_boid, *_sums[_boid._id])
 
-    # step 2: calculate steer factor
-    if _steer_factor.length() > 0:
-        _steer_factor /= _nearby_boids
-        _steer_factor = _steer_factor.normalize() * _nearby_boids
 
-    # step 3: calculate cohesion factor
-    boid._cohesion_point = _cohesion_factor.copy()
-    if _cohesion_factor.length() > 0:
-        _cohesion_factor /= _nearby_boids
-        _cohesion_factor = _cohesion_factor - boid._position
+def flock_aggregates(boids: list, bvh: bvh.BVHContainer2D):
+    """
+    Run the flocking interaction using the BVH subtree aggregates.
 
-        _cohesion_factor.normalize_ip()
+    Alignment and cohesion only need the summed velocity / position and a
+    count, so nodes entirely inside the detection circle are consumed whole.
+    Separation stays exact, but only for boids within `separation_radius`
+    (the BVH opens every node near the boid so none are missed).
+    """
+    _threshold = BOID_LOGIC_CONSTANTS["distance_threshold"]
+    _separation = BOID_LOGIC_CONSTANTS["separation_radius"]
+    _periodic = BOID_LOGIC_CONSTANTS["periodic_boundary"] == 1
+
+    for _boid in boids:
+        _position_sum, _velocity_sum, _count, _objects = bvh.query_aggregate(
+            _boid._position,
+            _threshold,
+            exact_radius=_separation,
+            exclude=_boid,
+            periodic=_periodic,
+        )
 
-    # finalize acceleration
-    boid._push = (
-        _push_factor
-        * BOID_LOGIC_CONSTANTS["push_factor"]
-        * BOID_LOGIC_CONSTANTS["enable_push"]
-    )
-    boid._steer = (
-        _steer_factor
-        * BOID_LOGIC_CONSTANTS["steer_factor"]
-        * BOID_LOGIC_CONSTANTS["enable_steer"]
-    )
-    boid._cohesion = (
-        _cohesion_factor
-        * BOID_LOGIC_CONSTANTS["cohesion_factor"]
-        * BOID_LOGIC_CONSTANTS["enable_cohesion"]
+        # push factor - only the near field
+        _push_factor = pygame.Vector2(0, 0)
+        for _other_boid in _objects:
+            _displacement = _displacement_to(_boid, _other_boid, _periodic)
+            _displacement_length = _displacement.length()
+            if 0 < _displacement_length < _separation:
+                _push_factor += _displacement / _displacement_length**2 * 10
+
+        _apply_flocking(
+            _boid,
+            _push_factor,
+            _boid._velocity + _velocity_sum,
+            _position_sum,
+            _count,
+        )
+
+
+def flock_barnes_hut(boids: list, bvh: bvh.BVHContainer2D):
+    """
+    Run the flocking interaction with a Barnes-Hut far-field approximation.
+
+    Distant BVH nodes (size / distance below `theta`) act as one heavy boid
+    at their centroid with the average velocity, for separation as well as
+    alignment and cohesion.
+    """
+    _threshold = BOID_LOGIC_CONSTANTS["distance_threshold"]
+    _theta = BOID_LOGIC_CONSTANTS["theta"]
+    _periodic = BOID_LOGIC_CONSTANTS["periodic_boundary"] == 1
+
+    for _boid in boids:
+        _steer_factor = _boid._velocity.copy()
+        _push_factor = pygame.Vector2(0, 0)
+        _cohesion_factor = pygame.Vector2(0, 0)
+        _nearby_boids = 0
+
+        # positions come back as the images next to the boid
+        for _position, _velocity, _weight in bvh.query_barnes_hut(
+            _boid._position, _threshold, _theta, exclude=_boid, periodic=_periodic
+        ):
+            _displacement = _position - _boid._position
+            _displacement_length = _displacement.length()
+
+            # push factor - avoid others
+            if _displacement_length > 0:
+                _push_factor += _displacement / _displacement_length**2 * 10 * _weight
+            # steer factor - follow others directions
+            _steer_factor += _velocity * _weight
+            # cohesion factor - average of neighbors
+            _cohesion_factor += _position * _weight
+
+            _nearby_boids += _weight
+
+        _apply_flocking(
+            _boid, _push_factor, _steer_factor, _cohesion_factor, _nearby_boids
+        )
+
+
+def look_ahead(boids: list, bvh: bvh.BVHContainer2D):
+    """
+    Cast a ray ahead of every boid (one batched cast for the whole flock) and
+    steer sideways away from whatever it would run into.
+    """
+    _distance = BOID_LOGIC_CONSTANTS["lookahead_distance"]
+    _hits = bvh.raycast_batch(
+        [_boid._position for _boid in boids],
+        [_boid._velocity for _boid in boids],
+        _distance,
     )
-    boid._acceleration.xy = boid._push + boid._steer + boid._cohesion
+
+    for _boid, _hit in zip(boids, _hits):
+        _boid._avoid.xy = (0, 0)
+        if _hit is None:
+            continue
+        _t, _other_boid = _hit
+
+        # steer perpendicular to the heading, away from the hit
+        _heading = _boid._velocity.normalize()
+        _away = _boid._position - _other_boid._position
+        _lateral = _away - _heading * _away.dot(_heading)
+        if _lateral.length() == 0:
+            _lateral = _heading.rotate(90)
+
+        _boid._avoid = (
+            _lateral.normalize()
+            * BOID_LOGIC_CONSTANTS["avoid_factor"]
+            * (1 - _t / _distance)
+        )
+
+
+def avoid_obstacles(boids: list, layer: obstacles.ObstacleLayer):
+    """
+    Add a push away from nearby static obstacles to every boid's avoidance.
+    """
+    _radius = BOID_LOGIC_CONSTANTS["obstacle_radius"]
+    for _boid in boids:
+        _boid._avoid += (
+            layer.avoidance(_boid._position, _radius)
+            * BOID_LOGIC_CONSTANTS["obstacle_factor"]
+        )
+
+
+def hunt_and_flee(boids: list, bvh: bvh.BVHContainer2D):
+    """
+    Predator / prey rules -- flee from nearby predators, chase the nearest
+    prey. The species masks let the BVH skip subtrees without any of them.
+    """
+    _flee_radius = BOID_LOGIC_CONSTANTS["flee_radius"]
+    _chase_radius = BOID_LOGIC_CONSTANTS["chase_radius"]
+    _periodic = BOID_LOGIC_CONSTANTS["periodic_boundary"] == 1
+
+    for _boid in boids:
+        _species = BOID_SPECIES[_boid._species]
+
+        if _species["predators"]:
+            if _periodic:
+                _predators = bvh.query_periodic(
+                    _boid._position,
+                    _flee_radius,
+                    exclude=_boid,
+                    mask=_species["predators"],
+                )
+            else:
+                _predators = [
+                    (_other_boid, _other_boid._position - _boid._position)
+                    for _node in bvh.get_colliding_nodes(
+                        pygame.FRect(
+                            _boid._position.x - _flee_radius,
+                            _boid._position.y - _flee_radius,
+                            _flee_radius * 2,
+                            _flee_radius * 2,
+                        ),
+                        mask=_species["predators"],
+                    )
+                    for _other_boid in _node._objects
+                    if _other_boid is not _boid
+                    and (1 << _other_boid._species) & _species["predators"]
+                ]
+            for _other_boid, _displacement in _predators:
+                _displacement_length = _displacement.length()
+                if 0 < _displacement_length < _flee_radius:
+                    _boid._avoid -= (
+                        _displacement
+                        / _displacement_length
+                        * BOID_LOGIC_CONSTANTS["flee_factor"]
+                        * (1 - _displacement_length / _flee_radius)
+                    )
+
+        if _species["prey"]:
+            _nearest = bvh.query_knn(
+                _boid._position,
+                1,
+                _chase_radius,
+                exclude=_boid,
+                mask=_species["prey"],
+                periodic=_periodic,
+            )
+            if _nearest:
+                _displacement = _displacement_to(_boid, _nearest[0], _periodic)
+                if _displacement.length() > 0:
+                    _boid._avoid += (
+                        _displacement.normalize() * BOID_LOGIC_CONSTANTS["chase_factor"]
+                    )
 
 
-def _handle_boids(boids, bvh, surface, delta):
-    main_boid = boids[list(boids.keys())[0]]
+def apply_flow_field(boids: list, flow_field: field.FlowField):
+    """
+    Add the flow field's steering to every boid (one batched sample).
+    """
+    _forces = flow_field.sample_batch([_boid._position for _boid in boids])
+    for _boid, _force in zip(boids, _forces):
+        _boid._avoid += _force * BOID_LOGIC_CONSTANTS["field_factor"]
+
+
+def _handle_boids(boids, bvh, delta):
+    main_boid = boids[_boid_slots[_main_boid_id]]
     # print(
     #     f"{main_boid._id} | "
     #     f"{main_boid._push.x:>7.2f}, {main_boid._push.y:>7.2f} | "
@@ -243,119 +1028,171 @@ def _handle_boids(boids, bvh, surface, delta):
     # )
 
     # print(BOID_LOGIC_CONSTANTS)
-    # draw triangles surrounding the boids
-    for _key in boids.keys():
-        boid = boids[_key]
-        color = boid._color
-        if boid._id != main_boid._id:
-            color = colorsys.hsv_to_rgb(
-                boid._acceleration.length() / (15 * INIT_SPEED_RANGE[0]),
-                1,
-                1,
-            )
-            color = tuple(int(c * 255) for c in color)
-        position = boid._position
-        velocity = boid._velocity
 
+    # leaf pair mode computes every acceleration up front. these whole
+    # flock passes share leaves + aggregates across species, so with species
+    # on every boid runs its own masked query instead
+    _whole_flock = (
+        BOID_LOGIC_CONSTANTS["use_bvh"] == 1
+        and BOID_LOGIC_CONSTANTS["enable_species"] != 1
+    )
+    _use_leaf_pairs = _whole_flock and BOID_LOGIC_CONSTANTS["use_leaf_pairs"] == 1
+    _use_barnes_hut = _whole_flock and BOID_LOGIC_CONSTANTS["use_barnes_hut"] == 1
+    _use_aggregates = _whole_flock and BOID_LOGIC_CONSTANTS["use_aggregates"] == 1
+    if BOID_LOGIC_CONSTANTS["enable_lookahead"] == 1:
+        look_ahead(boids, bvh)
+    else:
+        for boid in boids:
+            boid._avoid.xy = (0, 0)
+    if BOID_LOGIC_CONSTANTS["enable_obstacles"] == 1 and _obstacle_layer is not None:
+        avoid_obstacles(boids, _obstacle_layer)
+    if BOID_LOGIC_CONSTANTS["enable_field"] == 1 and _flow_field.has_sources():
+        apply_flow_field(boids, _flow_field)
+    if BOID_LOGIC_CONSTANTS["enable_species"] == 1:
+        # merge the species overrides with the current slider values
+        for i, _species in enumerate(BOID_SPECIES):
+            _species_constants[i] = {
+                **BOID_LOGIC_CONSTANTS,
+                **_species["constants"],
+            }
+        hunt_and_flee(boids, bvh)
+
+    if _use_barnes_hut:
+        flock_barnes_hut(boids, bvh)
+    elif _use_aggregates:
+        flock_aggregates(boids, bvh)
+    elif _use_leaf_pairs and BOID_LOGIC_CONSTANTS["symmetric_pairs"] == 1:
+        flock_symmetric_pairs(boids, bvh)
+    elif _use_leaf_pairs:
+        flock_leaf_pairs(boids, bvh)
+
+    # rotation jitter for the whole flock in one draw
+    _jitter = None
+    if BOID_LOGIC_CONSTANTS["enable_random_movement"] == 1:
+        _angle = int(BOID_LOGIC_CONSTANTS["random_angle"])
+        _jitter = _rng.choices(range(-_angle, _angle + 1), k=len(boids))
+
+    # update the boids
+    for boid_index, boid in enumerate(boids):
         # implement boid logic
-        boid_logic(boid, boids, bvh)
-
-        # keep boid velocity in a certain range
-        if boid._velocity.length() < INIT_SPEED_RANGE[0]:
-            boid._velocity = boid._velocity.normalize() * INIT_SPEED_RANGE[0]
-        if boid._velocity.length() > INIT_SPEED_RANGE[1] + INIT_SPEED_RANGE[0]:
-            boid._velocity = boid._velocity.normalize() * (
-                INIT_SPEED_RANGE[1] + INIT_SPEED_RANGE[0]
-            )
+        if not (_use_leaf_pairs or _use_aggregates or _use_barnes_hut):
+            boid_logic(boid, boids, bvh)
 
         # move boid
-        boid._position += boid._velocity * delta
-        boid._velocity += boid._acceleration * delta
-        if BOID_LOGIC_CONSTANTS["enable_random_movement"] == 1:
-            boid._velocity.rotate_ip(
-                random.randint(
-                    -BOID_LOGIC_CONSTANTS["random_angle"],
-                    BOID_LOGIC_CONSTANTS["random_angle"],
-                )
-            )
+        flocking.integrate(
+            boid,
+            delta,
+            INIT_SPEED_RANGE,
+            W_FB_SIZE,
+            _jitter[boid_index] if _jitter is not None else 0,
+        )
 
-        # check if out of bounds
-        if boid._position.x < 0:
-            boid._position.x = W_FB_SIZE[0]
-        if boid._position.x > W_FB_SIZE[0]:
-            boid._position.x = 0
-        if boid._position.y < 0:
-            boid._position.y = W_FB_SIZE[1]
-        if boid._position.y > W_FB_SIZE[1]:
-            boid._position.y = 0
 
-        # calculate angle of rotation
-        angle = UP.angle_to(velocity)
+def draw_boid(boid: boid.Boid, main_boid: boid.Boid, surface, points: bool = False):
+    """
+    Draw a boid through the camera (and its debug vectors when enabled).
 
-        # rotate triangle
-        rotated_triangle = [point.rotate(angle) + position for point in BOID_TRIANGLE]
+    With `points` only a dot is drawn -- the level of detail when zoomed out.
+    """
+    color = boid._color
+    if boid is not main_boid and BOID_LOGIC_CONSTANTS["enable_species"] == 1:
+        color = colorsys.hsv_to_rgb(BOID_SPECIES[boid._species]["hue"], 1, 1)
+        color = tuple(int(c * 255) for c in color)
+    elif boid is not main_boid:
+        color = colorsys.hsv_to_rgb(
+            boid._acceleration.length() / (15 * INIT_SPEED_RANGE[0]),
+            1,
+            1,
+        )
+        color = tuple(int(c * 255) for c in color)
+    position = W_CAMERA.world_to_screen(boid._position)
+    velocity = boid._velocity
+
+    if points:
+        surface.fill(color, (position.x - 1, position.y - 1, 2, 2))
+        return
+    scale = W_CAMERA.get_scale()
 
-        # draw lines
-        pygame.draw.lines(surface, color, True, rotated_triangle, width=3)
+    # calculate angle of rotation
+    angle = UP.angle_to(velocity)
 
-        if not BOID_LOGIC_CONSTANTS["enable_vectors"]:
-            continue
+    # rotate triangle
+    rotated_triangle = [
+        point.rotate(angle) * scale + position for point in BOID_TRIANGLE
+    ]
+
+    # draw lines
+    pygame.draw.lines(
+        surface, color, True, rotated_triangle, width=max(1, round(3 * scale))
+    )
+
+    if not BOID_LOGIC_CONSTANTS["enable_vectors"]:
+        return
 
-        # draw push, steer, and cohesion vectors
+    # draw push, steer, and cohesion vectors
+    _length = 20 * scale
+    pygame.draw.line(
+        surface,
+        (255, 255, 0),
+        position,
+        # position + velocity.normalize() * 20,
+        (
+            position + boid._push.normalize() * _length
+            if boid._push.length() > 0
+            else position
+        ),
+        width=1,
+    )
+    pygame.draw.line(
+        surface,
+        (0, 255, 0),
+        position,
+        # position + velocity.normalize() * 20,
+        (
+            position + boid._steer.normalize() * _length
+            if boid._steer.length() > 0
+            else position
+        ),
+        width=1,
+    )
+    pygame.draw.line(
+        surface,
+        (255, 0, 0),
+        position,
+        # position + velocity.normalize() * 20,
+        (
+            position + boid._cohesion.normalize() * _length
+            if boid._cohesion.length() > 0
+            else position
+        ),
+        width=1,
+    )
+    if boid._avoid.length() > 0:
         pygame.draw.line(
             surface,
-            (255, 255, 0),
+            (0, 255, 255),
             position,
-            # position + velocity.normalize() * 20,
-            (
-                position + boid._push.normalize() * 20
-                if boid._push.length() > 0
-                else position
-            ),
+            position + boid._avoid.normalize() * _length,
             width=1,
         )
-        pygame.draw.line(
+
+    # draw a circle
+    if main_boid is boid:
+        pygame.draw.circle(
             surface,
             (0, 255, 0),
             position,
-            # position + velocity.normalize() * 20,
-            (
-                position + boid._steer.normalize() * 20
-                if boid._steer.length() > 0
-                else position
-            ),
+            BOID_LOGIC_CONSTANTS["distance_threshold"] * scale,
             width=1,
         )
-        pygame.draw.line(
+        # draw weighted average flock position
+        pygame.draw.circle(
             surface,
-            (255, 0, 0),
-            position,
-            # position + velocity.normalize() * 20,
-            (
-                position + boid._cohesion.normalize() * 20
-                if boid._cohesion.length() > 0
-                else position
-            ),
-            width=1,
+            (255, 255, 255),
+            position + boid._cohesion_point * scale,
+            5,
         )
 
-        # draw a circle
-        if main_boid._id == boid._id:
-            pygame.draw.circle(
-                surface,
-                (0, 255, 0),
-                position,
-                BOID_LOGIC_CONSTANTS["distance_threshold"],
-                width=1,
-            )
-            # draw weighted average flock position
-            pygame.draw.circle(
-                surface,
-                (255, 255, 255),
-                position + boid._cohesion_point,
-                5,
-            )
-
 
 # ------------------------------------------------------------------------ #
 # pygame sliders
@@ -526,7 +1363,7 @@ if True:
         ui.UISlider(
             pygame.FRect(0, 330, 200, 20),
             min_value=10,
-            max_value=500,
+            max_value=MIN_SPEED_MAX,
             default_value=INIT_SPEED_RANGE[0],
             update_func=update_min_speed_ui,
         )
@@ -547,7 +1384,7 @@ if True:
         ui.UISlider(
             pygame.FRect(0, 390, 200, 20),
             min_value=0,
-            max_value=500,
+            max_value=DETECTION_RADIUS_MAX,
             default_value=BOID_LOGIC_CONSTANTS["distance_threshold"],
             update_func=update_detection_radius_ui,
         )
@@ -622,6 +1459,9 @@ if True:
             BOID_LOGIC_CONSTANTS["use_bvh"] = 0
         else:
             BOID_LOGIC_CONSTANTS["use_bvh"] = 1
+        # picking by hand takes over from the tuner
+        BOID_LOGIC_CONSTANTS["auto_tune"] = 0
+        _auto_tune_button._value = False
 
     ui_container.add_element(
         ui.UILabel(
@@ -629,45 +1469,526 @@ if True:
             text="Use BVH",
         )
     )
+    # kept so the tuner can show its choice
+    _use_bvh_button = ui.UIButton(
+        pygame.FRect(200, 540, 25, 25),
+        onclick=update_use_bvh,
+        default_value=BOID_LOGIC_CONSTANTS["use_bvh"],
+    )
+    ui_container.add_element(_use_bvh_button)
+
+    # use leaf pair interaction lists
+    def update_use_leaf_pairs():
+        if BOID_LOGIC_CONSTANTS["use_leaf_pairs"] == 1:
+            BOID_LOGIC_CONSTANTS["use_leaf_pairs"] = 0
+        else:
+            BOID_LOGIC_CONSTANTS["use_leaf_pairs"] = 1
+
+    ui_container.add_element(
+        ui.UILabel(
+            pygame.FRect(0, 570, 200, 20),
+            text="Leaf Pairs",
+        )
+    )
     ui_container.add_element(
         ui.UIButton(
-            pygame.FRect(200, 540, 25, 25),
-            onclick=update_use_bvh,
-            default_value=BOID_LOGIC_CONSTANTS["use_bvh"],
+            pygame.FRect(200, 570, 25, 25),
+            onclick=update_use_leaf_pairs,
+            default_value=BOID_LOGIC_CONSTANTS["use_leaf_pairs"],
         )
     )
 
+    # evaluate each leaf pair once for both sides
+    def update_symmetric_pairs():
+        if BOID_LOGIC_CONSTANTS["symmetric_pairs"] == 1:
+            BOID_LOGIC_CONSTANTS["symmetric_pairs"] = 0
+        else:
+            BOID_LOGIC_CONSTANTS["symmetric_pairs"] = 1
+
+    ui_container.add_element(
+        ui.UILabel(
+            pygame.FRect(0, 600, 200, 20),
+            text="Symmetric Pairs",
+        )
+    )
+    ui_container.add_element(
+        ui.UIButton(
+            pygame.FRect(200, 600, 25, 25),
+            onclick=update_symmetric_pairs,
+            default_value=BOID_LOGIC_CONSTANTS["symmetric_pairs"],
+        )
+    )
+
+    # use bvh subtree aggregates for alignment + cohesion
+    def update_use_aggregates():
+        if BOID_LOGIC_CONSTANTS["use_aggregates"] == 1:
+            BOID_LOGIC_CONSTANTS["use_aggregates"] = 0
+        else:
+            BOID_LOGIC_CONSTANTS["use_aggregates"] = 1
+
+    ui_container.add_element(
+        ui.UILabel(
+            pygame.FRect(300, 0, 200, 20),
+            text="Use Aggregates",
+        )
+    )
+    ui_container.add_element(
+        ui.UIButton(
+            pygame.FRect(500, 0, 25, 25),
+            onclick=update_use_aggregates,
+            default_value=BOID_LOGIC_CONSTANTS["use_aggregates"],
+        )
+    )
+
+    # add slider for separation radius
+    def update_separation_radius_ui(value):
+        # update the separation radius in the boid logic constants
+        BOID_LOGIC_CONSTANTS["separation_radius"] = value
+
+    ui_container.add_element(
+        ui.UILabel(
+            pygame.FRect(300, 30, 200, 20),
+            text="Separation Radius",
+        )
+    )
+    ui_container.add_element(
+        ui.UISlider(
+            pygame.FRect(300, 60, 200, 20),
+            min_value=0,
+            max_value=200,
+            default_value=BOID_LOGIC_CONSTANTS["separation_radius"],
+            update_func=update_separation_radius_ui,
+        )
+    )
+
+    # barnes-hut far field approximation
+    def update_use_barnes_hut():
+        if BOID_LOGIC_CONSTANTS["use_barnes_hut"] == 1:
+            BOID_LOGIC_CONSTANTS["use_barnes_hut"] = 0
+        else:
+            BOID_LOGIC_CONSTANTS["use_barnes_hut"] = 1
+
+    ui_container.add_element(
+        ui.UILabel(
+            pygame.FRect(300, 90, 200, 20),
+            text="Barnes-Hut",
+        )
+    )
+    ui_container.add_element(
+        ui.UIButton(
+            pygame.FRect(500, 90, 25, 25),
+            onclick=update_use_barnes_hut,
+            default_value=BOID_LOGIC_CONSTANTS["use_barnes_hut"],
+        )
+    )
+
+    # add slider for barnes-hut accuracy
+    def update_theta_ui(value):
+        # update theta in the boid logic constants
+        BOID_LOGIC_CONSTANTS["theta"] = value
+
+    ui_container.add_element(
+        ui.UILabel(
+            pygame.FRect(300, 120, 200, 20),
+            text="Theta",
+        )
+    )
+    ui_container.add_element(
+        ui.UISlider(
+            pygame.FRect(300, 150, 200, 20),
+            min_value=0,
+            max_value=2,
+            default_value=BOID_LOGIC_CONSTANTS["theta"],
+            update_func=update_theta_ui,
+        )
+    )
+
+    # topological (k nearest) neighbors
+    def update_use_knn():
+        if BOID_LOGIC_CONSTANTS["use_knn"] == 1:
+            BOID_LOGIC_CONSTANTS["use_knn"] = 0
+        else:
+            BOID_LOGIC_CONSTANTS["use_knn"] = 1
+
+    ui_container.add_element(
+        ui.UILabel(
+            pygame.FRect(300, 180, 200, 20),
+            text="K Nearest",
+        )
+    )
+    ui_container.add_element(
+        ui.UIButton(
+            pygame.FRect(500, 180, 25, 25),
+            onclick=update_use_knn,
+            default_value=BOID_LOGIC_CONSTANTS["use_knn"],
+        )
+    )
+
+    # add slider for k
+    def update_knn_k_ui(value):
+        # update k in the boid logic constants
+        BOID_LOGIC_CONSTANTS["knn_k"] = int(value)
+
+    ui_container.add_element(
+        ui.UILabel(
+            pygame.FRect(300, 210, 200, 20),
+            text="Neighbors (k)",
+        )
+    )
+    ui_container.add_element(
+        ui.UISlider(
+            pygame.FRect(300, 240, 200, 20),
+            min_value=1,
+            max_value=30,
+            default_value=BOID_LOGIC_CONSTANTS["knn_k"],
+            update_func=update_knn_k_ui,
+        )
+    )
+
+    # ray cast ahead for avoidance
+    def update_enable_lookahead():
+        if BOID_LOGIC_CONSTANTS["enable_lookahead"] == 1:
+            BOID_LOGIC_CONSTANTS["enable_lookahead"] = 0
+        else:
+            BOID_LOGIC_CONSTANTS["enable_lookahead"] = 1
+
+    ui_container.add_element(
+        ui.UILabel(
+            pygame.FRect(300, 270, 200, 20),
+            text="Look Ahead",
+        )
+    )
+    ui_container.add_element(
+        ui.UIButton(
+            pygame.FRect(500, 270, 25, 25),
+            onclick=update_enable_lookahead,
+            default_value=BOID_LOGIC_CONSTANTS["enable_lookahead"],
+        )
+    )
+
+    # avoid static obstacles
+    def update_enable_obstacles():
+        if BOID_LOGIC_CONSTANTS["enable_obstacles"] == 1:
+            BOID_LOGIC_CONSTANTS["enable_obstacles"] = 0
+        else:
+            BOID_LOGIC_CONSTANTS["enable_obstacles"] = 1
+
+    ui_container.add_element(
+        ui.UILabel(
+            pygame.FRect(300, 300, 200, 20),
+            text="Obstacles",
+        )
+    )
+    ui_container.add_element(
+        ui.UIButton(
+            pygame.FRect(500, 300, 25, 25),
+            onclick=update_enable_obstacles,
+            default_value=BOID_LOGIC_CONSTANTS["enable_obstacles"],
+        )
+    )
+
+    # wrap neighbor queries around the world edges
+    def update_periodic_boundary():
+        if BOID_LOGIC_CONSTANTS["periodic_boundary"] == 1:
+            BOID_LOGIC_CONSTANTS["periodic_boundary"] = 0
+        else:
+            BOID_LOGIC_CONSTANTS["periodic_boundary"] = 1
+
+    ui_container.add_element(
+        ui.UILabel(
+            pygame.FRect(300, 330, 200, 20),
+            text="Periodic Boundary",
+        )
+    )
+    ui_container.add_element(
+        ui.UIButton(
+            pygame.FRect(500, 330, 25, 25),
+            onclick=update_periodic_boundary,
+            default_value=BOID_LOGIC_CONSTANTS["periodic_boundary"],
+        )
+    )
+
+    # add slider for the population
+    def update_population_ui(value):
+        global _target_population
+        _target_population = int(value)
+
+    ui_container.add_element(
+        ui.UILabel(
+            pygame.FRect(300, 360, 200, 20),
+            text="Population",
+        )
+    )
+    _population_slider = ui.UISlider(
+        pygame.FRect(300, 390, 200, 20),
+        min_value=1,
+        max_value=5000,
+        default_value=SIMULATION_SIZE,
+        update_func=update_population_ui,
+    )
+    ui_container.add_element(_population_slider)
+
+    # multi species flocks + predator / prey
+    def update_enable_species():
+        if BOID_LOGIC_CONSTANTS["enable_species"] == 1:
+            BOID_LOGIC_CONSTANTS["enable_species"] = 0
+        else:
+            BOID_LOGIC_CONSTANTS["enable_species"] = 1
+
+    ui_container.add_element(
+        ui.UILabel(
+            pygame.FRect(300, 420, 200, 20),
+            text="Species",
+        )
+    )
+    ui_container.add_element(
+        ui.UIButton(
+            pygame.FRect(500, 420, 25, 25),
+            onclick=update_enable_species,
+            default_value=BOID_LOGIC_CONSTANTS["enable_species"],
+        )
+    )
+
+    # flow field (attractors / repellers)
+    def update_enable_field():
+        if BOID_LOGIC_CONSTANTS["enable_field"] == 1:
+            BOID_LOGIC_CONSTANTS["enable_field"] = 0
+        else:
+            BOID_LOGIC_CONSTANTS["enable_field"] = 1
+
+    ui_container.add_element(
+        ui.UILabel(
+            pygame.FRect(300, 450, 200, 20),
+            text="Flow Field",
+        )
+    )
+    ui_container.add_element(
+        ui.UIButton(
+            pygame.FRect(500, 450, 25, 25),
+            onclick=update_enable_field,
+            default_value=BOID_LOGIC_CONSTANTS["enable_field"],
+        )
+    )
+
+    # pick the bvh depth / brute force automatically
+    def update_auto_tune():
+        if BOID_LOGIC_CONSTANTS["auto_tune"] == 1:
+            BOID_LOGIC_CONSTANTS["auto_tune"] = 0
+        else:
+            BOID_LOGIC_CONSTANTS["auto_tune"] = 1
+            _tuner.reset()
+
+    ui_container.add_element(
+        ui.UILabel(
+            pygame.FRect(300, 480, 200, 20),
+            text="Auto Tune BVH",
+        )
+    )
+    _auto_tune_button = ui.UIButton(
+        pygame.FRect(500, 480, 25, 25),
+        onclick=update_auto_tune,
+        default_value=BOID_LOGIC_CONSTANTS["auto_tune"],
+    )
+    ui_container.add_element(_auto_tune_button)
+
 # ------------------------------------------------------------------------ #
 # bvh
 # ------------------------------------------------------------------------ #
 
 
-def _handle_bvh(boids, surface, delta):
-    # update the bvh
-    _bounding_volume_hierarchy.update(list(boids.values()))
+def _handle_bvh(boids, delta):
+    global _morton_frame
+
+    _morton_frame += 1
+    if _morton_frame >= BOID_LOGIC_CONSTANTS["morton_sort_interval"]:
+        # re-sort storage so neighbors in space are close together in memory
+        # -- the sorted codes also make this build a few binary searches
+        _morton_frame = 0
+        _objects, _codes = bvh.sort_by_morton(
+            boids, _bounding_volume_hierarchy._world_area
+        )
+        boids[:] = _objects
+        for i, _boid in enumerate(boids):
+            _boid_slots[_boid._id] = i
+        _bounding_volume_hierarchy.update(_objects, codes=_codes)
+    else:
+        # in between the storage is still close to z-order, computing the
+        # codes every frame would cost more than the plain build saves
+        _bounding_volume_hierarchy.update(list(boids))
+
+
+def tune_broadphase(cost_ms: float):
+    """
+    Hand the frame's simulation cost to the tuner and apply its choice of
+    bvh depth (or brute force) for the next frame.
+    """
+    # these modes work on the bvh itself, brute force can't stand in
+    _needs_bvh = BOID_LOGIC_CONSTANTS["use_knn"] == 1 or (
+        BOID_LOGIC_CONSTANTS["enable_species"] != 1
+        and any(
+            BOID_LOGIC_CONSTANTS[_key] == 1
+            for _key in ("use_leaf_pairs", "use_aggregates", "use_barnes_hut")
+        )
+    )
+    _choice = _tuner.update(
+        cost_ms,
+        len(_boids_container),
+        BOID_LOGIC_CONSTANTS["distance_threshold"],
+        brute_force=not _needs_bvh,
+    )
+
+    BOID_LOGIC_CONSTANTS["use_bvh"] = _choice != tuner.BRUTE_FORCE
+    _use_bvh_button._value = BOID_LOGIC_CONSTANTS["use_bvh"]
+    # brute force keeps the last depth -- drawing + look ahead still use it
+    if _choice != tuner.BRUTE_FORCE:
+        _bounding_volume_hierarchy._max_depth = _choice
+
+
+# ------------------------------------------------------------------------ #
+# rendering
+# ------------------------------------------------------------------------ #
+
+
+def draw_world(boids, surface):
+    """
+    Draw what the camera sees -- the visible boids are found through the
+    bvh, so the cost follows what is on screen, not the population.
+    """
+    W_CAMERA.update()
+    main_boid = boids[_boid_slots[_main_boid_id]]
+
+    # the triangles reach a bit past the boid position
+    _view = W_CAMERA.get_view()
+    _margin = _view.inflate(BOID_SIZE * 2, BOID_SIZE * 2)
+    _points = W_CAMERA.get_zoom() < LOD_POINT_ZOOM
+    for _node in _bounding_volume_hierarchy.get_colliding_nodes(_margin):
+        for _boid in _node._objects:
+            if _margin.collidepoint(_boid._position):
+                draw_boid(_boid, main_boid, surface, points=_points)
+
+    # draw the static obstacles
+    if BOID_LOGIC_CONSTANTS["enable_obstacles"] == 1 and _obstacle_layer is not None:
+        _obstacle_layer.draw(surface, camera=W_CAMERA)
+
+    # draw the flow field sources
+    if BOID_LOGIC_CONSTANTS["enable_field"] == 1:
+        _flow_field.draw(
+            surface,
+            draw_vectors=BOID_LOGIC_CONSTANTS["enable_vectors"],
+            camera=W_CAMERA,
+        )
 
     # draw the bvh
     _bounding_volume_hierarchy.draw(
         surface,
         only_leaf=BOID_LOGIC_CONSTANTS["only_bvh_leaf"],
         draw_vectors=BOID_LOGIC_CONSTANTS["enable_vectors"],
+        camera=W_CAMERA,
     )
 
 
+# ------------------------------------------------------------------------ #
+# domains
+# ------------------------------------------------------------------------ #
+
+
+def _handle_domains(boids, surface, delta):
+    global _scatter_pending
+
+    if _scatter_pending:
+        _domains.scatter(boids)
+        _scatter_pending = False
+
+    _domains.step(delta, BOID_LOGIC_CONSTANTS)
+
+    # the boids here only mirror the workers -- don't copy if nobody looks
+    if (
+        surface is None
+        and _publisher is None
+        and _recorder is None
+        and _telemetry is None
+    ):
+        return
+    _domains.gather_into(boids, _boid_slots)
+
+    # only needed to cull the drawing
+    if surface is not None:
+        _bounding_volume_hierarchy.update(boids)
+
+
 # ------------------------------------------------------------------------ #
 # game loop
 # ------------------------------------------------------------------------ #
 
-_create_world()
-_handle_boids(_boids_container, _bounding_volume_hierarchy, W_FRAMEBUFFER, W_DELTA)
-_handle_bvh(_boids_container, W_FRAMEBUFFER, W_DELTA)
+_frame_total = 0
+
+if W_ARGS.resume:
+    load_checkpoint(W_ARGS.resume)
+else:
+    _create_world()
+
+# command line overrides win over a resumed snapshot
+for _assignment in W_ARGS.set:
+    _key, _, _value = _assignment.partition("=")
+    if _key not in BOID_LOGIC_CONSTANTS:
+        W_ARGS_PARSER.error(f"unknown constant {_key}")
+    apply_command({"cmd": "set", "key": _key, "value": float(_value)})
+
+# nothing is drawn when headless
+_surface = None if W_ARGS.headless else W_FRAMEBUFFER
+
+# a resumed snapshot already is the state after its last frame
+if not W_ARGS.resume:
+    _handle_boids(_boids_container, _bounding_volume_hierarchy, W_DELTA)
+    _handle_bvh(_boids_container, W_DELTA)
+
+# fork the workers before any other thread is started
+if W_ARGS.domains:
+    _cols, _, _rows = W_ARGS.domains.partition("x")
+    _domains = domain.DomainDecomposition(
+        W_FB_SIZE,
+        (int(_cols), int(_rows)),
+        INIT_SPEED_RANGE,
+        # halos reach as far as the detection radius slider goes
+        max(DETECTION_RADIUS_MAX, BOID_LOGIC_CONSTANTS["distance_threshold"]),
+        max_depth=_bounding_volume_hierarchy._max_depth,
+        seed=W_SEED,
+    )
+    print(f"simulating on {int(_cols) * int(_rows)} worker processes")
+
+if W_ARGS.record:
+    start_recording(W_ARGS.record)
+
+if W_ARGS.feed:
+    _publisher = feed.StatePublisher(
+        W_ARGS.feed,
+        capacity=W_ARGS.feed_capacity,
+        world_size=W_FB_SIZE,
+    )
+    print(f"publishing to shared memory {_publisher.get_name()}")
+
+if W_ARGS.telemetry is not None:
+    _telemetry = telemetry.TelemetryServer(
+        "127.0.0.1",
+        W_ARGS.telemetry,
+        world_size=W_FB_SIZE,
+        # the fastest the min speed slider allows, with room for the
+        # acceleration added after the speed clamp
+        velocity_range=2 * (MIN_SPEED_MAX + INIT_SPEED_RANGE[1]),
+        keys=BOID_LOGIC_CONSTANTS.keys(),
+    )
+    print(f"telemetry on 127.0.0.1:{_telemetry.get_port()}")
+
+# per frame timings, streamed to telemetry clients
+_metrics = {}
 
 W_GLOBAL_START = time.time()
 
 W_RUNNING = True
 
 _delta_total = 0
-_frame_total = 0
+# frames run in this session (a resumed run starts at the saved frame)
+_frame_first = _frame_total
 
 while W_RUNNING:
 
@@ -686,39 +2007,141 @@ while W_RUNNING:
             elif e.key == pygame.K_r:
                 # reset boids
                 _create_world()
+            elif e.key == pygame.K_p:
+                # pause / resume
+                _paused = not _paused
+            elif e.key in (pygame.K_EQUALS, pygame.K_PLUS, pygame.K_KP_PLUS):
+                # spawn more boids
+                _target_population = len(_boids_container) + 100
+            elif e.key in (pygame.K_a, pygame.K_z):
+                # add an attractor / repeller under the mouse
+                _mouse = W_CAMERA.screen_to_world(pygame.mouse.get_pos())
+                _flow_field.add_source(
+                    _mouse,
+                    1 if e.key == pygame.K_a else -1,
+                    BOID_LOGIC_CONSTANTS["field_source_radius"],
+                )
+            elif e.key == pygame.K_F5:
+                # checkpoint
+                save_checkpoint(W_ARGS.checkpoint)
+            elif e.key == pygame.K_F6:
+                # toggle trajectory recording
+                if _recorder is None:
+                    start_recording(W_ARGS.record or "trajectory.boidtraj")
+                else:
+                    stop_recording()
+            elif e.key == pygame.K_F9:
+                # resume from the checkpoint
+                if os.path.exists(W_ARGS.checkpoint):
+                    load_checkpoint(W_ARGS.checkpoint)
+            elif e.key == pygame.K_c:
+                # clear the flow field
+                _flow_field.clear()
+            elif e.key in (pygame.K_MINUS, pygame.K_KP_MINUS):
+                # despawn boids
+                _target_population = max(1, len(_boids_container) - 100)
+            elif e.key == pygame.K_f:
+                # follow the main boid
+                if W_CAMERA.get_target() is None:
+                    W_CAMERA.follow(_boids_container[_boid_slots[_main_boid_id]])
+                else:
+                    W_CAMERA.follow(None)
+            elif e.key == pygame.K_HOME:
+                # reset the camera
+                W_CAMERA.reset()
+        if e.type == pygame.MOUSEWHEEL:
+            # zoom around the mouse
+            W_CAMERA.zoom_at(1.1**e.y, pygame.mouse.get_pos())
+        if e.type == pygame.MOUSEMOTION and (e.buttons[1] or e.buttons[2]):
+            # pan with the middle / right mouse button
+            W_CAMERA.pan(e.rel)
         if e.type == pygame.VIDEORESIZE:
             W_SIZE = e.w, e.h
             W_WINDOW = pygame.display.set_mode(W_SIZE, W_FLAGS, W_BIT_DEPTH)
-            W_BUF_SIZE = (W_SIZE[0] * 1.03, W_SIZE[1] * 1.03)
-            W_BUF_POS = (
-                -(W_BUF_SIZE[0] - W_SIZE[0]) // 2,
-                -(W_BUF_SIZE[1] - W_SIZE[1]) // 2,
-            )
+            W_FRAMEBUFFER = pygame.Surface(W_SIZE).convert_alpha()
+            W_CAMERA.set_screen_size(W_SIZE)
+            if _surface is not None:
+                _surface = W_FRAMEBUFFER
+
+    # remote control
+    if _telemetry is not None:
+        for _command in _telemetry.poll_commands():
+            apply_command(_command)
+
+    # grow / shrink the flock -- in place in the bvh, so this frame's queries
+    # see the change without a rebuild (the rebuild after the step is for
+    # the movement)
+    if _target_population != len(_boids_container):
+        set_population(_target_population)
+        # follow on the slider without firing it -- keys and telemetry may go
+        # past its range, the knob just stays at the end
+        _population_slider._value = _population_slider._last_value = min(
+            len(_boids_container), _population_slider._max_value
+        )
 
     # update game state
-    W_FRAMEBUFFER.fill(W_BACKGROUND_COLOR)
-
-    if not pygame.key.get_pressed()[pygame.K_BACKSPACE]:
-        # handle objects + rendering
-        _handle_boids(
-            _boids_container, _bounding_volume_hierarchy, W_FRAMEBUFFER, W_DELTA
-        )
-        _handle_bvh(_boids_container, W_FRAMEBUFFER, W_DELTA)
+    if _surface is not None:
+        _surface.fill(W_BACKGROUND_COLOR)
+
+    if not (_paused or pygame.key.get_pressed()[pygame.K_BACKSPACE]):
+        # handle objects
+        _time = time.perf_counter()
+        if _domains is not None:
+            _handle_domains(_boids_container, _surface, W_DELTA)
+            _metrics["boids_ms"] = (time.perf_counter() - _time) * 1000
+        else:
+            _handle_boids(_boids_container, _bounding_volume_hierarchy, W_DELTA)
+            _metrics["boids_ms"] = (time.perf_counter() - _time) * 1000
+            _time = time.perf_counter()
+            _handle_bvh(_boids_container, W_DELTA)
+            _metrics["bvh_ms"] = (time.perf_counter() - _time) * 1000
+
+            if BOID_LOGIC_CONSTANTS["auto_tune"] == 1:
+                tune_broadphase(_metrics["boids_ms"] + _metrics["bvh_ms"])
+
+        # stream the new state to disk
+        if _recorder is not None:
+            _recorder.record(_frame_total, _boids_container)
+
+        # and to anyone attached to the feed
+        if _publisher is not None:
+            _publisher.publish(_frame_total, _boids_container)
+
+        # and to telemetry subscribers
+        if _telemetry is not None:
+            _metrics["frame_ms"] = W_DELTA * 1000
+            _metrics["population"] = len(_boids_container)
+            _metrics["bvh_depth"] = (
+                _bounding_volume_hierarchy._max_depth
+                if BOID_LOGIC_CONSTANTS["use_bvh"] == 1
+                else tuner.BRUTE_FORCE
+            )
+            _telemetry.publish(_frame_total, _boids_container, _metrics)
 
-        # render to window
-        W_WINDOW.blit(pygame.transform.scale(W_FRAMEBUFFER, W_BUF_SIZE), W_BUF_POS)
+    # render to window -- also while paused, so the camera can look around
+    if _surface is not None:
+        _time = time.perf_counter()
+        draw_world(_boids_container, _surface)
+        W_WINDOW.blit(_surface, (0, 0))
+        _metrics["draw_ms"] = (time.perf_counter() - _time) * 1000
 
     # draw ui
-    ui_container.draw(W_WINDOW)
-
-    pygame.display.flip()
+    if _surface is not None:
+        ui_container.draw(W_WINDOW)
+        pygame.display.flip()
     W_END = time.time()
     W_DELTA = W_END - W_START
 
     _delta_total += W_DELTA
     _frame_total += 1
 
-    W_DELTA = W_CLOCK.tick(W_FPS) / 1000
+    # headless runs are not capped to the frame rate
+    W_DELTA = W_CLOCK.tick(0 if W_ARGS.headless and not _paused else W_FPS) / 1000
+    if W_ARGS.fixed_step:
+        W_DELTA = 1 / W_FPS
+
+    if W_ARGS.frames > 0 and _frame_total >= W_ARGS.frames:
+        W_RUNNING = False
 
     # auto stop after 10 seconds
     # if time.time() - W_GLOBAL_START > 10:
@@ -727,5 +2150,13 @@ while W_RUNNING:
     # print(time.time() - W_GLOBAL_START)
 
 
-print(_delta_total / _frame_total * 1000)
+stop_recording()
+if _publisher is not None:
+    _publisher.close()
+if _telemetry is not None:
+    _telemetry.close()
+if _domains is not None:
+    _domains.close()
+
+print(_delta_total / max(1, _frame_total - _frame_first) * 1000)
 pygame.quit()
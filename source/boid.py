@@ -1,5 +1,9 @@
+import itertools
+
 import pygame
-import uuid
+
+# dense integer ids, handed out in creation order
+_ID_COUNTER = itertools.count()
 
 # ------------------------------------------------------------------------ #
 # boid class
@@ -21,16 +25,39 @@ class Boid:
     - has a position
     - has a velocity
     - has an acceleration
+    - belongs to a species
 
+    Boids use __slots__ -- there can be a lot of them, and a fixed layout
+    keeps them small and attribute access cheap.
     """
 
+    __slots__ = (
+        "_id",
+        "_position",
+        "_velocity",
+        "_acceleration",
+        "_color",
+        "_push",
+        "_steer",
+        "_cohesion",
+        "_cohesion_point",
+        "_avoid",
+        "_species",
+    )
+
     def __init__(self):
-        self._id = uuid.uuid4()
+        self._id = next(_ID_COUNTER)
         self._position = pygame.Vector2()
         self._velocity = pygame.Vector2()
         self._acceleration = pygame.Vector2()
         self._color = (255, 255, 255)
+        # index into the species table (flocking rules + bvh mask bit)
+        self._species = 0
 
         self._push = pygame.Vector2()
         self._steer = pygame.Vector2()
         self._cohesion = pygame.Vector2()
+        self._cohesion_point = pygame.Vector2()
+
+        # avoidance from look ahead casts
+        self._avoid = pygame.Vector2()
@@ -1,5 +1,217 @@
+import bisect
+import heapq
+import itertools
+import math
+
 import pygame
 
+# ------------------------------------------------------------------------ #
+# helpers
+# ------------------------------------------------------------------------ #
+
+
+def rect_distance_squared(a: pygame.FRect, b: pygame.FRect):
+    """
+    Return the squared distance between two rects (0 if they overlap).
+    """
+    dx = max(a.left - b.right, b.left - a.right, 0)
+    dy = max(a.top - b.bottom, b.top - a.bottom, 0)
+    return dx * dx + dy * dy
+
+
+def rect_distance_squared_periodic(a: pygame.FRect, b: pygame.FRect, size):
+    """
+    Squared distance between two rects in a world of `size` (width, height)
+    that wraps around at its edges -- the closest images are compared.
+    """
+    dx = min(
+        max(a.left - b.right - shift, b.left + shift - a.right, 0)
+        for shift in (-size[0], 0, size[0])
+    )
+    dy = min(
+        max(a.top - b.bottom - shift, b.top + shift - a.bottom, 0)
+        for shift in (-size[1], 0, size[1])
+    )
+    return dx * dx + dy * dy
+
+
+def _image_shift(lo: float, hi: float, point: float, size: float):
+    """
+    -size, 0 or size -- the shift that moves [lo, hi] closest to `point` on
+    a wrapped axis.
+    """
+    best = 0
+    best_gap = max(lo - point, 0, point - hi)
+    for shift in (-size, size):
+        gap = max(lo + shift - point, 0, point - hi - shift)
+        if gap < best_gap:
+            best, best_gap = shift, gap
+    return best
+
+
+def _wrap(value: float, size: float):
+    """
+    Minimum image of a single displacement component.
+    """
+    if value > size / 2:
+        return value - size
+    if value < -size / 2:
+        return value + size
+    return value
+
+
+# bits per axis of a morton code -- supports trees up to this depth
+MORTON_BITS = 16
+
+
+def _part1by1(n: int):
+    """
+    Spread the lower 16 bits of n so there is a zero between each bit.
+    """
+    n &= 0x0000FFFF
+    n = (n | (n << 8)) & 0x00FF00FF
+    n = (n | (n << 4)) & 0x0F0F0F0F
+    n = (n | (n << 2)) & 0x33333333
+    n = (n | (n << 1)) & 0x55555555
+    return n
+
+
+def morton_code(position, world_area: pygame.FRect):
+    """
+    Z-order curve index of a position inside `world_area`.
+
+    The y bit sits above the x bit at every level, so the top 2 bits are the
+    quadrant in BVH child order (top-left, top-right, bottom-left,
+    bottom-right), the next 2 bits the quadrant inside that, and so on.
+    """
+    cells = 1 << MORTON_BITS
+    x = int((position[0] - world_area.x) / world_area.width * cells)
+    y = int((position[1] - world_area.y) / world_area.height * cells)
+    x = min(max(x, 0), cells - 1)
+    y = min(max(y, 0), cells - 1)
+    return _part1by1(x) | (_part1by1(y) << 1)
+
+
+def sort_by_morton(objects: list, world_area: pygame.FRect):
+    """
+    Sort objects along the Z-order curve of their positions.
+
+    Returns (sorted objects, sorted codes). Sorting is close to linear when
+    the input is already nearly in order (e.g. re-sorted every few frames).
+    """
+    keyed = sorted(
+        ((morton_code(o._position, world_area), i) for i, o in enumerate(objects))
+    )
+    return [objects[i] for _, i in keyed], [code for code, _ in keyed]
+
+
+def _rect_overlaps(a: pygame.FRect, b: pygame.FRect):
+    """
+    Inclusive rect overlap test -- unlike colliderect, a zero sized rect (a
+    leaf holding a single object) still counts.
+    """
+    return (
+        a.left <= b.right
+        and b.left <= a.right
+        and a.top <= b.bottom
+        and b.top <= a.bottom
+    )
+
+
+def _rect_contains(rect: pygame.FRect, point):
+    """
+    Inclusive point-in-rect test (works for zero sized rects too).
+    """
+    return rect.left <= point[0] <= rect.right and rect.top <= point[1] <= rect.bottom
+
+
+def minimum_image(displacement: pygame.Vector2, size):
+    """
+    Wrap a displacement onto the shortest image in a periodic world of
+    `size` (width, height).
+    """
+    x, y = displacement
+    w, h = size
+    if x > w / 2:
+        x -= w
+    elif x < -w / 2:
+        x += w
+    if y > h / 2:
+        y -= h
+    elif y < -h / 2:
+        y += h
+    return pygame.Vector2(x, y)
+
+
+def _wrap_interval(lo: float, hi: float, start: float, size: float):
+    """
+    Split [lo, hi] against the periodic range [start, start + size].
+
+    Returns a list of (lo, hi, offset) -- the part inside the range plus the
+    parts hanging over either edge, shifted back inside. `offset` is what has
+    to be added to an object found there to get its image next to the query.
+    """
+    end = start + size
+    if hi - lo >= size:
+        # covers the whole range anyway
+        return [(start, end, 0)]
+
+    result = [(max(lo, start), min(hi, end), 0)]
+    if lo < start:
+        result.append((lo + size, end, -size))
+    if hi > end:
+        result.append((start, hi - size, size))
+    return result
+
+
+def _ray_rect(ox, oy, dx, dy, rect: pygame.FRect, pad: float, t_max: float):
+    """
+    Slab test of a ray against `rect` grown by `pad` on every side.
+
+    Returns the entry distance along the ray, or None if the ray misses the
+    rect before `t_max`.
+    """
+    t_enter = 0.0
+    t_exit = t_max
+
+    for o, d, lo, hi in (
+        (ox, dx, rect.left - pad, rect.right + pad),
+        (oy, dy, rect.top - pad, rect.bottom + pad),
+    ):
+        if d == 0:
+            # parallel to the slab -- must already be inside it
+            if o < lo or o > hi:
+                return None
+            continue
+        t0 = (lo - o) / d
+        t1 = (hi - o) / d
+        if t0 > t1:
+            t0, t1 = t1, t0
+        t_enter = max(t_enter, t0)
+        t_exit = min(t_exit, t1)
+        if t_enter > t_exit:
+            return None
+
+    return t_enter
+
+
+def _ray_circle(ox, oy, dx, dy, center, radius: float):
+    """
+    Return the distance along a (normalized) ray to a circle, or None.
+
+    Circles that contain the ray origin are ignored, so a ray cast from an
+    object's own position never hits that object.
+    """
+    cx = center[0] - ox
+    cy = center[1] - oy
+    tca = cx * dx + cy * dy
+    d2 = cx * cx + cy * cy - tca * tca
+    if d2 > radius * radius:
+        return None
+    t = tca - math.sqrt(radius * radius - d2)
+    return t if t >= 0 else None
+
+
 # ------------------------------------------------------------------------ #
 # bvh class
 # ------------------------------------------------------------------------ #
@@ -9,24 +221,38 @@ class BVHContainer2D:
     PARTITION_COUNT = 4
 
     def __init__(
-        self, world_area: pygame.FRect, max_depth: int = 2, objects: list = []
+        self,
+        world_area: pygame.FRect,
+        max_depth: int = 2,
+        objects: list = [],
+        extended_objects: bool = False,
     ):
         self._world_area = world_area
         self._max_depth = max_depth
 
+        # objects with their own `_bounding_area` (e.g. obstacles) instead of
+        # just a `_position`
+        self._extended_objects = extended_objects
+
         self._root = self.construct(objects, world_area, 0)
 
     # ---------------------------------------------------- #
     # properties
     # ---------------------------------------------------- #
 
-    def update(self, objects):
+    def update(self, objects, codes: list = None):
         """
         Update the BVH tree with a new list of objects.
+
+        If `codes` is given, `objects` must be sorted by those morton codes
+        (see sort_by_morton) -- every quadrant is then a contiguous slice and
+        partitioning is a few binary searches instead of a scan per child.
         """
-        self._root = self.construct(objects, self._world_area, 0)
+        self._root = self.construct(objects, self._world_area, 0, codes)
 
-    def construct(self, objects: list, world_area: pygame.FRect, depth: int):
+    def construct(
+        self, objects: list, world_area: pygame.FRect, depth: int, codes: list = None
+    ):
         """
         Construct the BVH tree from a list of objects.
         """
@@ -52,35 +278,49 @@ class BVHContainer2D:
                 ),  # bottom-right
             ]
 
-            children = [
-                self.construct(
-                    [o for o in objects if areas[0].collidepoint(o._position)],
-                    areas[0],
-                    depth + 1,
-                ),
-                self.construct(
-                    [o for o in objects if areas[1].collidepoint(o._position)],
-                    areas[1],
-                    depth + 1,
-                ),
-                self.construct(
-                    [o for o in objects if areas[2].collidepoint(o._position)],
-                    areas[2],
-                    depth + 1,
-                ),
-                self.construct(
-                    [o for o in objects if areas[3].collidepoint(o._position)],
-                    areas[3],
-                    depth + 1,
-                ),
-            ]
+            if codes is not None:
+                # morton sorted -- split at the 4 quadrant boundaries
+                _shift = 2 * (MORTON_BITS - 1 - depth)
+                _base = (codes[0] >> (_shift + 2) << (_shift + 2)) if codes else 0
+                _splits = [0]
+                for q in range(1, 4):
+                    _splits.append(bisect.bisect_left(codes, _base + (q << _shift)))
+                _splits.append(len(codes))
+
+                children = [
+                    self.construct(
+                        objects[_splits[q] : _splits[q + 1]],
+                        areas[q],
+                        depth + 1,
+                        codes[_splits[q] : _splits[q + 1]],
+                    )
+                    for q in range(4)
+                ]
+            else:
+                # one pass -- same quadrant rule as insert(), so objects on
+                # the far world edges aren't lost
+                _cx = world_area.x + _width
+                _cy = world_area.y + _height
+                _quadrants = [[], [], [], []]
+                for o in objects:
+                    _quadrants[
+                        (o._position.x >= _cx) + 2 * (o._position.y >= _cy)
+                    ].append(o)
+                children = [
+                    self.construct(_quadrants[q], areas[q], depth + 1) for q in range(4)
+                ]
 
             result._children = children
             for c in children:
                 # set parent
                 c._parent = result
-                result._bounding_area.union_ip(c._bounding_area)
+                # empty children have no meaningful bounding area
+                if c._object_count > 0:
+                    result._bounding_area.union_ip(c._bounding_area)
                 result._object_count += c._object_count
+                result._position_sum += c._position_sum
+                result._velocity_sum += c._velocity_sum
+                result._species_mask |= c._species_mask
 
         else:
             # if depth is max, we need to do math
@@ -94,8 +334,13 @@ class BVHContainer2D:
                 _max[0] = max(_max[0], o._position.x)
                 _max[1] = max(_max[1], o._position.y)
 
+                # subtree aggregates
+                result._position_sum += o._position
+                result._velocity_sum += o._velocity
+                result._species_mask |= 1 << o._species
+
             # if no objects, return empty
-            if _min[0] == _max[0] and _min[1] == _max[1]:
+            if not objects:
                 _min = [0, 0]
                 _max = [0, 0]
 
@@ -105,6 +350,9 @@ class BVHContainer2D:
                 _max[0] - _min[0],
                 _max[1] - _min[1],
             )
+            if self._extended_objects:
+                for o in objects:
+                    result._bounding_area.union_ip(o._bounding_area)
 
             result._objects = objects
             result._object_count = len(objects)
@@ -116,20 +364,611 @@ class BVHContainer2D:
         # return result
         return result
 
-    def draw(self, surface, only_leaf: bool = False, draw_vectors: bool = False):
+    def draw(
+        self,
+        surface,
+        only_leaf: bool = False,
+        draw_vectors: bool = False,
+        camera=None,
+    ):
         """
-        Draw the BVH tree.
+        Draw the BVH tree -- through a camera, only the nodes in its view.
         """
-        self._root.draw(surface, None, only_leaf=only_leaf, draw_vectors=draw_vectors)
+        self._root.draw(
+            surface,
+            None,
+            only_leaf=only_leaf,
+            draw_vectors=draw_vectors,
+            camera=camera,
+            view=camera.get_view() if camera is not None else None,
+        )
 
     def get_root(self):
         return self._root
 
-    def get_colliding_nodes(self, rect):
+    def get_colliding_nodes(self, rect, mask: int = None):
         """
         Return a list of all colliding nodes.
+
+        With a species `mask`, subtrees holding none of those species are
+        skipped.
+        """
+        return self._root.get_colliding_bvh(rect, mask)
+
+    def query_aggregate(
+        self,
+        point: pygame.Vector2,
+        radius: float,
+        exact_radius: float = 0,
+        exclude=None,
+        periodic: bool = False,
+    ):
         """
-        return self._root.get_colliding_bvh(rect)
+        Sum the positions and velocities of all objects within `radius` of
+        `point`.
+
+        Nodes whose bounding area lies entirely inside the circle are consumed
+        through their aggregates; only partially overlapping nodes are opened.
+        Nodes touching the `exact_radius` circle, or that may hold `exclude`,
+        are always opened. Every object visited individually (and within
+        `radius`) is also returned, so the caller can run exact per-object
+        terms on the near field.
+
+        In a `periodic` world positions are summed as the images closest to
+        the point.
+
+        Returns (position_sum, velocity_sum, count, objects).
+        """
+        position_sum = pygame.Vector2()
+        velocity_sum = pygame.Vector2()
+        count = 0
+        objects = []
+
+        radius_sq = radius * radius
+        exact_sq = exact_radius * exact_radius
+        px, py = point
+        w, h = self._world_area.size
+
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node._object_count == 0:
+                continue
+
+            # closest + farthest distance from the point to the bounding area
+            rect = node._bounding_area
+            sx = sy = 0
+            if periodic:
+                sx = _image_shift(rect.left, rect.right, px, w)
+                sy = _image_shift(rect.top, rect.bottom, py, h)
+            left, right = rect.left + sx, rect.right + sx
+            top, bottom = rect.top + sy, rect.bottom + sy
+            dx = max(left - px, 0, px - right)
+            dy = max(top - py, 0, py - bottom)
+            if dx * dx + dy * dy >= radius_sq:
+                continue
+            fx = max(px - left, right - px)
+            fy = max(py - top, bottom - py)
+
+            if (
+                fx * fx + fy * fy < radius_sq
+                and dx * dx + dy * dy >= exact_sq
+                and (exclude is None or not _rect_contains(rect, exclude._position))
+                # every object's shifted image is also its minimum image
+                and (not periodic or (fx <= w / 2 and fy <= h / 2))
+            ):
+                # fully inside -- take the whole subtree at once
+                position_sum += node._position_sum
+                if sx or sy:
+                    position_sum += pygame.Vector2(sx, sy) * node._object_count
+                velocity_sum += node._velocity_sum
+                count += node._object_count
+                continue
+
+            if not node._is_leaf:
+                stack.extend(node._children)
+                continue
+
+            for o in node._objects:
+                if o is exclude:
+                    continue
+                ox = o._position.x - px
+                oy = o._position.y - py
+                if periodic:
+                    ox = _wrap(ox, w)
+                    oy = _wrap(oy, h)
+                if ox * ox + oy * oy < radius_sq:
+                    if periodic:
+                        position_sum += (px + ox, py + oy)
+                    else:
+                        position_sum += o._position
+                    velocity_sum += o._velocity
+                    count += 1
+                    objects.append(o)
+
+        return position_sum, velocity_sum, count, objects
+
+    def query_barnes_hut(
+        self,
+        point: pygame.Vector2,
+        radius: float,
+        theta: float,
+        exclude=None,
+        periodic: bool = False,
+    ):
+        """
+        Approximate the objects within `radius` of `point` Barnes-Hut style.
+
+        A node whose size / distance ratio is below `theta` is treated as a
+        single pseudo object at its centroid carrying the average velocity.
+        Everything else is opened down to individual objects. A theta of 0
+        gives the exact neighbor set.
+
+        In a `periodic` world the returned positions are the images closest
+        to the point.
+
+        Returns a list of (position, velocity, weight).
+        """
+        result = []
+        radius_sq = radius * radius
+        theta_sq = theta * theta
+        px, py = point
+        w, h = self._world_area.size
+
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node._object_count == 0:
+                continue
+
+            rect = node._bounding_area
+            sx = sy = 0
+            if periodic:
+                sx = _image_shift(rect.left, rect.right, px, w)
+                sy = _image_shift(rect.top, rect.bottom, py, h)
+            dx = max(rect.left + sx - px, 0, px - rect.right - sx)
+            dy = max(rect.top + sy - py, 0, py - rect.bottom - sy)
+            if dx * dx + dy * dy >= radius_sq:
+                continue
+
+            # far field -- size / distance to centroid under theta
+            centroid = node._position_sum / node._object_count
+            if sx or sy:
+                centroid += (sx, sy)
+            distance_sq = (centroid.x - px) ** 2 + (centroid.y - py) ** 2
+            size = max(rect.width, rect.height)
+            if (
+                node._object_count > 1
+                and distance_sq < radius_sq
+                and size * size < theta_sq * distance_sq
+                and (exclude is None or not _rect_contains(rect, exclude._position))
+            ):
+                result.append(
+                    (
+                        centroid,
+                        node._velocity_sum / node._object_count,
+                        node._object_count,
+                    )
+                )
+                continue
+
+            if not node._is_leaf:
+                stack.extend(node._children)
+                continue
+
+            for o in node._objects:
+                if o is exclude:
+                    continue
+                ox = o._position.x - px
+                oy = o._position.y - py
+                if periodic:
+                    ox = _wrap(ox, w)
+                    oy = _wrap(oy, h)
+                    if ox * ox + oy * oy < radius_sq:
+                        result.append(
+                            (pygame.Vector2(px + ox, py + oy), o._velocity, 1)
+                        )
+                elif ox * ox + oy * oy < radius_sq:
+                    result.append((o._position, o._velocity, 1))
+
+        return result
+
+    def query_knn(
+        self,
+        point: pygame.Vector2,
+        k: int,
+        max_radius: float,
+        exclude=None,
+        mask: int = None,
+        periodic: bool = False,
+    ):
+        """
+        Return the `k` objects nearest to `point` (within `max_radius`),
+        sorted nearest first. A species `mask` limits the search to those
+        species, and `periodic` measures distances in the wrapped world.
+
+        Best-first traversal -- nodes are visited in order of their distance
+        to the point and the search stops once the closest unvisited node is
+        farther away than the current k-th neighbor.
+        """
+        if k <= 0:
+            return []
+
+        px, py = point
+        w, h = self._world_area.size
+        limit_sq = max_radius * max_radius
+
+        # min heap of (distance to bounding area, tie breaker, node)
+        counter = itertools.count()
+        nodes = [(0.0, next(counter), self._root)]
+        # bounded max heap of (-distance, tie breaker, object)
+        found = []
+
+        while nodes:
+            distance_sq, _, node = heapq.heappop(nodes)
+            if distance_sq >= limit_sq:
+                break
+            if len(found) == k and distance_sq >= -found[0][0]:
+                break
+
+            if not node._is_leaf:
+                for child in node._children:
+                    if child._object_count == 0:
+                        continue
+                    if mask is not None and not child._species_mask & mask:
+                        continue
+                    rect = child._bounding_area
+                    sx = sy = 0
+                    if periodic:
+                        sx = _image_shift(rect.left, rect.right, px, w)
+                        sy = _image_shift(rect.top, rect.bottom, py, h)
+                    dx = max(rect.left + sx - px, 0, px - rect.right - sx)
+                    dy = max(rect.top + sy - py, 0, py - rect.bottom - sy)
+                    heapq.heappush(nodes, (dx * dx + dy * dy, next(counter), child))
+                continue
+
+            for o in node._objects:
+                if o is exclude:
+                    continue
+                if mask is not None and not (1 << o._species) & mask:
+                    continue
+                ox = o._position.x - px
+                oy = o._position.y - py
+                if periodic:
+                    ox = _wrap(ox, w)
+                    oy = _wrap(oy, h)
+                d = ox * ox + oy * oy
+                if d >= limit_sq:
+                    continue
+                if len(found) < k:
+                    heapq.heappush(found, (-d, next(counter), o))
+                elif d < -found[0][0]:
+                    heapq.heapreplace(found, (-d, next(counter), o))
+                    limit_sq = min(limit_sq, -found[0][0])
+
+        found.sort(reverse=True)
+        return [o for _, _, o in found]
+
+    # ---------------------------------------------------- #
+    # ray casts
+    # ---------------------------------------------------- #
+
+    def raycast(
+        self,
+        origin: pygame.Vector2,
+        direction: pygame.Vector2,
+        max_dist: float,
+        radius: float = 8,
+    ):
+        """
+        Cast a ray against the objects in the BVH (treated as circles of
+        `radius`).
+
+        Nodes are visited front to back by their slab entry distance and the
+        traversal stops as soon as the next node starts beyond the nearest
+        hit so far.
+
+        Returns (distance, object) for the nearest hit, or None.
+        """
+        if direction.length() == 0:
+            return None
+        dx, dy = direction.normalize()
+        ox, oy = origin
+
+        best_t = max_dist
+        best = None
+
+        counter = itertools.count()
+        nodes = [(0.0, next(counter), self._root)]
+        while nodes:
+            t_enter, _, node = heapq.heappop(nodes)
+            if t_enter >= best_t:
+                break
+
+            if not node._is_leaf:
+                for child in node._children:
+                    if child._object_count == 0:
+                        continue
+                    t = _ray_rect(ox, oy, dx, dy, child._bounding_area, radius, best_t)
+                    if t is not None:
+                        heapq.heappush(nodes, (t, next(counter), child))
+                continue
+
+            for o in node._objects:
+                t = _ray_circle(ox, oy, dx, dy, o._position, radius)
+                if t is not None and t < best_t:
+                    best_t = t
+                    best = o
+
+        return (best_t, best) if best is not None else None
+
+    def raycast_batch(
+        self, origins: list, directions: list, max_dist: float, radius: float = 8
+    ):
+        """
+        Cast many rays at once.
+
+        The rays travel down the tree together as a packet: each node is
+        tested once against the rays still able to improve on their nearest
+        hit, and children are visited in the order the packet reaches them.
+
+        Returns a list with (distance, object) or None per ray.
+        """
+        rays = []
+        for origin, direction in zip(origins, directions):
+            if direction.length() == 0:
+                rays.append(None)
+                continue
+            dx, dy = direction.normalize()
+            rays.append((origin[0], origin[1], dx, dy))
+
+        best_t = [max_dist] * len(rays)
+        best = [None] * len(rays)
+
+        active = [i for i, ray in enumerate(rays) if ray is not None]
+        stack = [(self._root, active)]
+        while stack:
+            node, active = stack.pop()
+
+            if node._is_leaf:
+                for i in active:
+                    ox, oy, dx, dy = rays[i]
+                    for o in node._objects:
+                        t = _ray_circle(ox, oy, dx, dy, o._position, radius)
+                        if t is not None and t < best_t[i]:
+                            best_t[i] = t
+                            best[i] = o
+                continue
+
+            # narrow the packet for every child
+            children = []
+            for child in node._children:
+                if child._object_count == 0:
+                    continue
+                rect = child._bounding_area
+                nearest = max_dist
+                hits = []
+                for i in active:
+                    t = _ray_rect(*rays[i], rect, radius, best_t[i])
+                    if t is not None:
+                        hits.append(i)
+                        nearest = min(nearest, t)
+                if hits:
+                    children.append((nearest, child, hits))
+
+            # stack is lifo -- push the farthest child first
+            children.sort(key=lambda c: c[0], reverse=True)
+            for _, child, hits in children:
+                stack.append((child, hits))
+
+        return [
+            (best_t[i], best[i]) if best[i] is not None else None
+            for i in range(len(rays))
+        ]
+
+    # ---------------------------------------------------- #
+    # periodic (toroidal) queries
+    # ---------------------------------------------------- #
+
+    def get_colliding_nodes_periodic(self, rect: pygame.FRect, mask: int = None):
+        """
+        Return (node, offset) pairs for a world that wraps around at the
+        edges of `_world_area`.
+
+        A rect crossing the world boundary is split into up to 4 sub rects
+        that are wrapped back inside; `offset` is the shift to apply to the
+        objects of that node to get their image next to the query.
+        """
+        world = self._world_area
+        result = []
+        for x0, x1, ox in _wrap_interval(rect.left, rect.right, world.x, world.width):
+            for y0, y1, oy in _wrap_interval(
+                rect.top, rect.bottom, world.y, world.height
+            ):
+                offset = pygame.Vector2(ox, oy)
+                for node in self._root.get_colliding_bvh(
+                    pygame.FRect(x0, y0, x1 - x0, y1 - y0), mask
+                ):
+                    result.append((node, offset))
+        return result
+
+    def query_periodic(
+        self,
+        point: pygame.Vector2,
+        radius: float,
+        exclude=None,
+        mask: int = None,
+    ):
+        """
+        Return (object, displacement) for every object within `radius` of
+        `point` in the wrapped world, with the minimum image displacement
+        from the point to the object. No ghost copies are stored.
+
+        A species `mask` limits the result to those species.
+        """
+        result = []
+        seen = set()
+        radius_sq = radius * radius
+        w, h = self._world_area.size
+        px, py = point
+        for node, offset in self.get_colliding_nodes_periodic(
+            pygame.FRect(px - radius, py - radius, radius * 2, radius * 2), mask
+        ):
+            ox, oy = offset
+            for o in node._objects:
+                if o is exclude:
+                    continue
+                if mask is not None and not (1 << o._species) & mask:
+                    continue
+                dx = o._position.x + ox - px
+                dy = o._position.y + oy - py
+                # minimum image
+                if dx > w / 2:
+                    dx -= w
+                elif dx < -w / 2:
+                    dx += w
+                if dy > h / 2:
+                    dy -= h
+                elif dy < -h / 2:
+                    dy += h
+                if dx * dx + dy * dy < radius_sq and id(o) not in seen:
+                    seen.add(id(o))
+                    result.append((o, pygame.Vector2(dx, dy)))
+        return result
+
+    # ---------------------------------------------------- #
+    # incremental updates
+    # ---------------------------------------------------- #
+
+    def insert(self, obj):
+        """
+        Add a single object without rebuilding the tree.
+
+        The object goes into the leaf whose quadrant holds its position, and
+        the counts, aggregates and bounding areas on the way up are grown to
+        include it.
+        """
+        node = self._root
+        while not node._is_leaf:
+            center = node._world_area.center
+            index = (obj._position.x >= center[0]) + 2 * (obj._position.y >= center[1])
+            node = node._children[index]
+
+        node._objects.append(obj)
+        point = pygame.FRect(obj._position, (0, 0))
+        while node is not None:
+            if node._object_count == 0:
+                node._bounding_area = point.copy()
+            else:
+                node._bounding_area.union_ip(point)
+            node._object_count += 1
+            node._position_sum += obj._position
+            node._velocity_sum += obj._velocity
+            node._species_mask |= 1 << obj._species
+            node = node._parent
+
+    def remove(self, obj):
+        """
+        Remove a single object without rebuilding the tree.
+
+        Bounding areas are left as they are -- still a valid (if slightly
+        loose) fit until the next rebuild.
+
+        Returns False if the object is not in the tree.
+        """
+        # the object may have moved since the build -- try where it is now,
+        # then fall back to every leaf
+        node = self._root
+        while not node._is_leaf:
+            center = node._world_area.center
+            index = (obj._position.x >= center[0]) + 2 * (obj._position.y >= center[1])
+            node = node._children[index]
+
+        for leaf in itertools.chain([node], self._root.iterate_leaves()):
+            objects = leaf._objects
+            for i, o in enumerate(objects):
+                if o is obj:
+                    # swap remove
+                    objects[i] = objects[-1]
+                    objects.pop()
+                    break
+            else:
+                continue
+
+            node = leaf
+            while node is not None:
+                node._object_count -= 1
+                node._position_sum -= obj._position
+                node._velocity_sum -= obj._velocity
+                node = node._parent
+            return True
+
+        return False
+
+    def get_leaves(self):
+        """
+        Return a list of all leaf nodes.
+        """
+        return list(self._root.iterate_leaves())
+
+    # ---------------------------------------------------- #
+    # dual tree traversal
+    # ---------------------------------------------------- #
+
+    def compute_interaction_lists(self, distance: float, periodic: bool = False):
+        """
+        Compute, for every leaf, the list of leaves whose bounding area is
+        within `distance` of its own bounding area (across the wrapped edges
+        if `periodic`).
+
+        The lists are stored on the leaves as `_interaction_list` (a leaf is
+        always in its own list). Each unordered leaf pair is also returned
+        exactly once.
+        """
+        for leaf in self._root.iterate_leaves():
+            leaf._interaction_list = []
+
+        pairs = []
+        size = self._world_area.size if periodic else None
+        self._dual_tree(self._root, self._root, distance * distance, pairs, size)
+        return pairs
+
+    def _dual_tree(self, a, b, distance_sq: float, pairs: list, size=None):
+        """
+        Recursively visit node pairs, pruning pairs that are too far apart.
+        """
+        if a._object_count == 0 or b._object_count == 0:
+            return
+        if size is None:
+            distance = rect_distance_squared(a._bounding_area, b._bounding_area)
+        else:
+            distance = rect_distance_squared_periodic(
+                a._bounding_area, b._bounding_area, size
+            )
+        if distance > distance_sq:
+            return
+
+        if a._is_leaf and b._is_leaf:
+            a._interaction_list.append(b)
+            if a is not b:
+                b._interaction_list.append(a)
+            pairs.append((a, b))
+            return
+
+        if a is b:
+            # self pair -- visit every unordered pair of children once
+            for i, child in enumerate(a._children):
+                for other in a._children[i:]:
+                    self._dual_tree(child, other, distance_sq, pairs, size)
+            return
+
+        # descend into the larger (shallower) node
+        if b._is_leaf or (not a._is_leaf and a._depth <= b._depth):
+            for child in a._children:
+                self._dual_tree(child, b, distance_sq, pairs, size)
+        else:
+            for child in b._children:
+                self._dual_tree(a, child, distance_sq, pairs, size)
 
 
 # ------------------------------------------------------------------------ #
@@ -163,12 +1002,30 @@ class BVHNode2D:
         self._objects = []
         self._object_count = 0
 
+        # summed position + velocity of every object in the subtree
+        self._position_sum = pygame.Vector2()
+        self._velocity_sum = pygame.Vector2()
+
+        # bit per species (`_species` of the objects) present in the subtree
+        self._species_mask = 0
+
+        # leaves within interaction distance -- see compute_interaction_lists
+        self._interaction_list = []
+
     def draw(
-        self, surface, color: tuple, only_leaf: bool = False, draw_vectors: bool = False
+        self,
+        surface,
+        color: tuple,
+        only_leaf: bool = False,
+        draw_vectors: bool = False,
+        camera=None,
+        view=None,
     ):
         """
         Draw the BVH node.
         """
+        if view is not None and not _rect_overlaps(self._bounding_area, view):
+            return
         if color is None:
             color = (255, 0, 0, 10)
 
@@ -184,6 +1041,8 @@ class BVHNode2D:
                 ),
                 only_leaf=only_leaf,
                 draw_vectors=draw_vectors,
+                camera=camera,
+                view=view,
             )
 
         if not draw_vectors:
@@ -195,20 +1054,38 @@ class BVHNode2D:
             pygame.draw.rect(
                 surface,
                 (color[0], color[1], color[2], color[3]),
-                self._bounding_area,
+                (
+                    camera.transform_rect(self._bounding_area)
+                    if camera is not None
+                    else self._bounding_area
+                ),
                 1,
             )
 
-    def get_colliding_bvh(self, rect):
+    def get_colliding_bvh(self, rect, mask: int = None):
         """Return a list of all colliding bvh nodes."""
+        # skip whole subtrees that are empty, out of range or hold none of
+        # the species in the mask
+        if self._object_count == 0 or not _rect_overlaps(self._bounding_area, rect):
+            return []
+        if mask is not None and not self._species_mask & mask:
+            return []
         if self._is_leaf:
-            return [self] if self._bounding_area.colliderect(rect) else []
+            return [self]
         else:
             result = []
             for child in self._children:
-                result += child.get_colliding_bvh(rect)
+                result += child.get_colliding_bvh(rect, mask)
             return result
 
+    def iterate_leaves(self):
+        """Yield all leaf nodes in this subtree."""
+        if self._is_leaf:
+            yield self
+            return
+        for child in self._children:
+            yield from child.iterate_leaves()
+
     def iterate_objects(self):
         """Return a list of all objects in this node."""
         if not self._is_leaf:
@@ -0,0 +1,137 @@
+import pygame
+
+# ------------------------------------------------------------------------ #
+# camera
+# ------------------------------------------------------------------------ #
+
+
+class Camera:
+    """
+    Camera -- a view onto the world
+
+    A zoom of 1 fits the whole world onto the screen; larger zooms show less
+    of it. The camera maps between world and screen coordinates, and its
+    view rect is what the renderer culls against.
+    """
+
+    def __init__(
+        self,
+        world_size,
+        screen_size,
+        zoom: float = 1,
+        min_zoom: float = 0.5,
+        max_zoom: float = 16,
+    ):
+        self._world_size = pygame.Vector2(world_size)
+        self._screen_size = pygame.Vector2(screen_size)
+        self._default_zoom = zoom
+        self._min_zoom = min_zoom
+        self._max_zoom = max_zoom
+
+        self._center = self._world_size / 2
+        self._zoom = zoom
+        # object to keep centered, if any
+        self._target = None
+
+    # ---------------------------------------------------- #
+    # transforms
+    # ---------------------------------------------------- #
+
+    def get_scale(self):
+        """
+        Screen pixels per world unit.
+        """
+        fit = min(
+            self._screen_size.x / self._world_size.x,
+            self._screen_size.y / self._world_size.y,
+        )
+        return fit * self._zoom
+
+    def get_zoom(self):
+        """
+        Zoom relative to fitting the whole world on screen.
+        """
+        return self._zoom
+
+    def world_to_screen(self, point):
+        return (pygame.Vector2(point) - self._center) * self.get_scale() + (
+            self._screen_size / 2
+        )
+
+    def screen_to_world(self, point):
+        return (pygame.Vector2(point) - self._screen_size / 2) / self.get_scale() + (
+            self._center
+        )
+
+    def transform_rect(self, rect):
+        """
+        A world rect in screen coordinates.
+        """
+        scale = self.get_scale()
+        topleft = self.world_to_screen(rect.topleft)
+        return pygame.FRect(topleft, (rect.width * scale, rect.height * scale))
+
+    def get_view(self, margin: float = 0):
+        """
+        The part of the world on screen, grown by `margin` world units.
+        """
+        size = self._screen_size / self.get_scale()
+        return pygame.FRect(
+            self._center.x - size.x / 2 - margin,
+            self._center.y - size.y / 2 - margin,
+            size.x + 2 * margin,
+            size.y + 2 * margin,
+        )
+
+    # ---------------------------------------------------- #
+    # movement
+    # ---------------------------------------------------- #
+
+    def pan(self, screen_offset):
+        """
+        Move the view by a screen space offset (stops following).
+        """
+        self._target = None
+        self._center -= pygame.Vector2(screen_offset) / self.get_scale()
+        self._clamp()
+
+    def zoom_at(self, factor: float, screen_point):
+        """
+        Zoom by `factor`, keeping the world point under `screen_point` fixed.
+        """
+        anchor = self.screen_to_world(screen_point)
+        self._zoom = min(max(self._zoom * factor, self._min_zoom), self._max_zoom)
+        if self._target is None:
+            self._center += anchor - self.screen_to_world(screen_point)
+        self._clamp()
+
+    def follow(self, target):
+        """
+        Keep an object (anything with a _position) centered, None to stop.
+        """
+        self._target = target
+
+    def get_target(self):
+        return self._target
+
+    def update(self):
+        """
+        Catch up with the followed object.
+        """
+        if self._target is not None:
+            self._center.xy = self._target._position
+            self._clamp()
+
+    def reset(self):
+        self._target = None
+        self._center = self._world_size / 2
+        self._zoom = self._default_zoom
+
+    def set_screen_size(self, screen_size):
+        self._screen_size = pygame.Vector2(screen_size)
+        self._clamp()
+
+    def _clamp(self):
+        # the center stays inside the world, so some of it is always on screen
+        self._center.x = min(max(self._center.x, 0), self._world_size.x)
+        self._center.y = min(max(self._center.y, 0), self._world_size.y)
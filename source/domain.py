@@ -0,0 +1,430 @@
+import math
+import multiprocessing
+import random
+import struct
+import threading
+from array import array
+
+import pygame
+
+from source import boid
+from source import bvh
+from source import flocking
+
+# ------------------------------------------------------------------------ #
+# domain decomposition
+# ------------------------------------------------------------------------ #
+#
+# the world is split into a cols x rows grid of cells, each owned by a
+# worker process with its own boids and its own bvh. every step
+#   1. halo      -- each worker sends its neighbors the boids within the
+#                   detection radius of their cell
+#   2. flock     -- accelerations from own + halo boids, then integrate
+#   3. migrate   -- boids that left the cell go to the neighbor they
+#                   crossed into
+# neighbors talk over their own pipes; the master only sends the step and
+# collects counts (or the full state when asked to gather). "neighbors" are
+# all cells within the largest detection radius (`max_threshold`), so with
+# cells smaller than the radius a worker also talks to cells further away.
+#
+# boids are packed as (little endian)
+#   count          Q
+#   ids            count Q
+#   positions      count * 2 doubles
+#   velocities     count * 2 doubles
+#   accelerations  count * 2 doubles
+#   species        count bytes
+#
+
+COUNT = struct.Struct("<Q")
+
+
+def _pack(boids: list):
+    ids = array("Q", [b._id for b in boids])
+    positions = array("d", [v for b in boids for v in b._position])
+    velocities = array("d", [v for b in boids for v in b._velocity])
+    accelerations = array("d", [v for b in boids for v in b._acceleration])
+    species = array("B", [b._species for b in boids])
+    return b"".join(
+        (
+            COUNT.pack(len(boids)),
+            ids.tobytes(),
+            positions.tobytes(),
+            velocities.tobytes(),
+            accelerations.tobytes(),
+            species.tobytes(),
+        )
+    )
+
+
+def _unpack(data: bytes):
+    """
+    Returns (ids, positions, velocities, accelerations, species) arrays.
+    """
+    (count,) = COUNT.unpack_from(data)
+    offset = COUNT.size
+    result = []
+    for typecode, size in (("Q", 1), ("d", 2), ("d", 2), ("d", 2), ("B", 1)):
+        values = array(typecode)
+        length = count * size * values.itemsize
+        values.frombytes(data[offset : offset + length])
+        offset += length
+        result.append(values)
+    return result
+
+
+def _fill(boids: list, data: bytes):
+    """
+    Unpack into boid objects, reusing the ones in `boids` and adding more
+    as needed. Returns the filled boids.
+    """
+    ids, positions, velocities, accelerations, species = _unpack(data)
+    while len(boids) < len(ids):
+        boids.append(boid.Boid())
+    for i in range(len(ids)):
+        _boid = boids[i]
+        _boid._id = ids[i]
+        _boid._position.xy = (positions[2 * i], positions[2 * i + 1])
+        _boid._velocity.xy = (velocities[2 * i], velocities[2 * i + 1])
+        _boid._acceleration.xy = (accelerations[2 * i], accelerations[2 * i + 1])
+        _boid._species = species[i]
+    return boids[: len(ids)]
+
+
+def _gap(value: float, low: float, high: float, size: float):
+    """
+    Distance from `value` to [low, high] on a wrapped axis.
+    """
+    if low <= value <= high:
+        return 0.0
+    return min((low - value) % size, (value - high) % size)
+
+
+def _step_towards(start: int, end: int, size: int):
+    """
+    -1, 0 or 1 -- the shortest way round from `start` to `end`.
+    """
+    difference = (end - start) % size
+    if difference == 0:
+        return 0
+    return 1 if difference <= size // 2 else -1
+
+
+# ------------------------------------------------------------------------ #
+# worker
+# ------------------------------------------------------------------------ #
+
+
+class _Worker:
+    """
+    Runs in its own process -- owns the boids of one cell.
+    """
+
+    def __init__(
+        self,
+        cell,
+        grid,
+        world_size,
+        speed_range,
+        max_depth: int,
+        seed: int,
+        master,
+        neighbors: dict,
+    ):
+        self._cell = cell
+        self._grid = grid
+        self._world_size = world_size
+        self._speed_range = speed_range
+        self._master = master
+        self._neighbors = neighbors
+        self._rng = random.Random(seed)
+
+        self._cell_size = (world_size[0] / grid[0], world_size[1] / grid[1])
+        self._rects = {
+            _cell: pygame.FRect(
+                _cell[0] * self._cell_size[0],
+                _cell[1] * self._cell_size[1],
+                self._cell_size[0],
+                self._cell_size[1],
+            )
+            for _cell in list(neighbors) + [cell]
+        }
+
+        self._boids = []
+        self._halo = []
+        # the bvh spans the whole world -- periodic queries wrap over it
+        self._bvh = bvh.BVHContainer2D(
+            pygame.FRect(0, 0, world_size[0], world_size[1]), max_depth=max_depth
+        )
+
+    def run(self):
+        while True:
+            message = self._master.recv()
+            if message[0] == "step":
+                self._step(message[1], message[2])
+                self._master.send(len(self._boids))
+            elif message[0] == "load":
+                self._boids = _fill([], message[1])
+                self._master.send(len(self._boids))
+            elif message[0] == "gather":
+                self._master.send_bytes(_pack(self._boids))
+            elif message[0] == "close":
+                return
+
+    def _exchange(self, outgoing: dict):
+        """
+        Send every neighbor its message and receive theirs. Sending happens
+        on a thread so two neighbors never block on each other's full pipe.
+        """
+
+        def _send():
+            for _cell, _conn in self._neighbors.items():
+                _conn.send_bytes(outgoing[_cell])
+
+        _sender = threading.Thread(target=_send)
+        _sender.start()
+        incoming = [_conn.recv_bytes() for _conn in self._neighbors.values()]
+        _sender.join()
+        return incoming
+
+    def _owner(self, position):
+        col = min(int(position.x / self._cell_size[0]), self._grid[0] - 1)
+        row = min(int(position.y / self._cell_size[1]), self._grid[1] - 1)
+        return col, row
+
+    def _step(self, delta: float, constants: dict):
+        w, h = self._world_size
+        threshold = constants["distance_threshold"]
+        periodic = constants["periodic_boundary"] == 1
+
+        # 1. halo exchange
+        outgoing = {}
+        for _cell in self._neighbors:
+            _rect = self._rects[_cell]
+            outgoing[_cell] = _pack(
+                [
+                    _b
+                    for _b in self._boids
+                    if _gap(_b._position.x, _rect.left, _rect.right, w) <= threshold
+                    and _gap(_b._position.y, _rect.top, _rect.bottom, h) <= threshold
+                ]
+            )
+        halo = []
+        for _data in self._exchange(outgoing):
+            # reuse the halo boid objects from the last step
+            _pool = self._halo[len(halo) :]
+            halo += _fill(_pool, _data)
+        self._halo = halo + self._halo[len(halo) :]
+
+        # 2. flock -- every acceleration from this step's state, then move
+        self._bvh.update(self._boids + halo)
+        world_size = self._world_size if periodic else None
+        for _boid in self._boids:
+            if periodic:
+                _neighbors = [
+                    _other
+                    for _other, _ in self._bvh.query_periodic(
+                        _boid._position, threshold, exclude=_boid
+                    )
+                ]
+            else:
+                _neighbors = [
+                    _other
+                    for _node in self._bvh.get_colliding_nodes(
+                        pygame.FRect(
+                            _boid._position.x - threshold,
+                            _boid._position.y - threshold,
+                            threshold * 2,
+                            threshold * 2,
+                        )
+                    )
+                    for _other in _node._objects
+                    if _other is not _boid
+                ]
+            flocking.apply_flocking(
+                _boid,
+                *flocking.accumulate_neighbors(_boid, _neighbors, world_size),
+                constants,
+            )
+
+        _jitter = [0] * len(self._boids)
+        if constants["enable_random_movement"] == 1:
+            _angle = int(constants["random_angle"])
+            _jitter = self._rng.choices(range(-_angle, _angle + 1), k=len(self._boids))
+        for _boid, _angle in zip(self._boids, _jitter):
+            flocking.integrate(
+                _boid, delta, self._speed_range, self._world_size, _angle
+            )
+
+        # 3. migrate -- towards the owner, one neighbor per step
+        outgoing = {_cell: [] for _cell in self._neighbors}
+        staying = []
+        for _boid in self._boids:
+            _owner = self._owner(_boid._position)
+            if _owner == self._cell:
+                staying.append(_boid)
+                continue
+            _next = (
+                (self._cell[0] + _step_towards(self._cell[0], _owner[0], self._grid[0]))
+                % self._grid[0],
+                (self._cell[1] + _step_towards(self._cell[1], _owner[1], self._grid[1]))
+                % self._grid[1],
+            )
+            outgoing[_next].append(_boid)
+        for _data in self._exchange(
+            {_cell: _pack(_boids) for _cell, _boids in outgoing.items()}
+        ):
+            staying += _fill([], _data)
+        self._boids = staying
+
+
+def _run_worker(*args):
+    _Worker(*args).run()
+
+
+# ------------------------------------------------------------------------ #
+# master
+# ------------------------------------------------------------------------ #
+
+
+class DomainDecomposition:
+    """
+    DomainDecomposition -- one flock simulated by a grid of worker processes
+
+    Workers are forked, so they start from the already imported modules
+    (main.py is a script and can't be re-imported by a spawned process).
+
+    Only the flocking rules run in the workers -- species, look ahead,
+    obstacles and the flow field are single process features.
+    """
+
+    def __init__(
+        self,
+        world_size,
+        grid,
+        speed_range,
+        max_threshold: float,
+        max_depth: int = 4,
+        seed: int = 0,
+    ):
+        self._grid = tuple(grid)
+        self._world_size = tuple(world_size)
+        self._cell_size = (world_size[0] / grid[0], world_size[1] / grid[1])
+        context = multiprocessing.get_context("fork")
+
+        # how many cells away a boid can still have neighbors
+        reach = [
+            max(1, math.ceil(max_threshold / self._cell_size[i])) for i in range(2)
+        ]
+        self._max_threshold = min(
+            reach[0] * self._cell_size[0], reach[1] * self._cell_size[1]
+        )
+
+        cells = [(col, row) for row in range(grid[1]) for col in range(grid[0])]
+
+        # one pipe per pair of neighboring cells (the grid wraps around)
+        links = {_cell: {} for _cell in cells}
+        for col, row in cells:
+            for dc in range(-reach[0], reach[0] + 1):
+                for dr in range(-reach[1], reach[1] + 1):
+                    _other = ((col + dc) % grid[0], (row + dr) % grid[1])
+                    if _other == (col, row) or _other in links[(col, row)]:
+                        continue
+                    a, b = context.Pipe()
+                    links[(col, row)][_other] = a
+                    links[_other][(col, row)] = b
+
+        self._masters = {}
+        self._processes = []
+        for i, _cell in enumerate(cells):
+            ours, theirs = context.Pipe()
+            process = context.Process(
+                target=_run_worker,
+                args=(
+                    _cell,
+                    self._grid,
+                    self._world_size,
+                    tuple(speed_range),
+                    max_depth,
+                    seed + i,
+                    theirs,
+                    links[_cell],
+                ),
+                daemon=True,
+            )
+            process.start()
+            self._masters[_cell] = ours
+            self._processes.append(process)
+
+        self._counts = {_cell: 0 for _cell in cells}
+
+    def _owner(self, position):
+        col = min(max(int(position[0] / self._cell_size[0]), 0), self._grid[0] - 1)
+        row = min(max(int(position[1] / self._cell_size[1]), 0), self._grid[1] - 1)
+        return col, row
+
+    def scatter(self, boids: list):
+        """
+        Replace the workers' boids with `boids`, each sent to its cell.
+        """
+        cells = {_cell: [] for _cell in self._masters}
+        for _boid in boids:
+            cells[self._owner(_boid._position)].append(_boid)
+        for _cell, _conn in self._masters.items():
+            _conn.send(("load", _pack(cells[_cell])))
+        for _cell, _conn in self._masters.items():
+            self._counts[_cell] = _conn.recv()
+
+    def step(self, delta: float, constants: dict):
+        """
+        Advance every cell by one step.
+        """
+        if constants["distance_threshold"] > self._max_threshold:
+            raise ValueError(
+                f"distance_threshold {constants['distance_threshold']} is beyond "
+                f"the halo reach {self._max_threshold:.1f} of this grid"
+            )
+        constants = dict(constants)
+        for _conn in self._masters.values():
+            _conn.send(("step", delta, constants))
+        for _cell, _conn in self._masters.items():
+            self._counts[_cell] = _conn.recv()
+
+    def gather_into(self, boids: list, slots: dict):
+        """
+        Copy the workers' state into the matching boids (by id, through the
+        id -> index map `slots`).
+        """
+        for _conn in self._masters.values():
+            _conn.send(("gather",))
+        for _conn in self._masters.values():
+            ids, positions, velocities, accelerations, _ = _unpack(_conn.recv_bytes())
+            for i, _id in enumerate(ids):
+                _slot = slots.get(_id)
+                if _slot is None:
+                    continue
+                _boid = boids[_slot]
+                _boid._position.xy = (positions[2 * i], positions[2 * i + 1])
+                _boid._velocity.xy = (velocities[2 * i], velocities[2 * i + 1])
+                _boid._acceleration.xy = (
+                    accelerations[2 * i],
+                    accelerations[2 * i + 1],
+                )
+
+    def get_max_threshold(self):
+        """
+        Largest distance_threshold the halos cover.
+        """
+        return self._max_threshold
+
+    def get_counts(self):
+        """
+        Boids per cell after the last step.
+        """
+        return dict(self._counts)
+
+    def close(self):
+        for _conn in self._masters.values():
+            _conn.send(("close",))
+        for process in self._processes:
+            process.join()
@@ -0,0 +1,264 @@
+import os
+import struct
+from array import array
+from multiprocessing import resource_tracker
+from multiprocessing import shared_memory
+
+# ------------------------------------------------------------------------ #
+# feed format
+# ------------------------------------------------------------------------ #
+#
+# header (native byte order, the feed never leaves the machine)
+#   magic        8s   b"BOIDFEED"
+#   version      I
+#   slots        I    frames kept in the ring
+#   capacity     Q    boids per frame
+#   world size   2d
+#   sequence     Q    sequence of the latest complete frame (0 = none yet)
+#
+# then `slots` frames, each
+#   sequence     Q    0 while the frame is being written
+#   frame        Q
+#   count        Q
+#   positions    capacity * 2 doubles (x, y, x, y, ...)
+#   velocities   capacity * 2 doubles
+#   ids          capacity unsigned 64 bit ints (Boid._id, the storage order
+#                changes between frames)
+#   species      capacity bytes, zero padded to 8
+#
+
+MAGIC = b"BOIDFEED"
+VERSION = 2
+HEADER = struct.Struct("=8sIIQddQ")
+SLOT = struct.Struct("=QQQ")
+SEQUENCE = struct.Struct("=Q")
+
+# offset of the latest sequence inside the header
+_SEQUENCE_OFFSET = HEADER.size - SEQUENCE.size
+
+
+def _slot_size(capacity: int):
+    return SLOT.size + capacity * 5 * 8 + capacity + (-capacity) % 8
+
+
+def _slot_views(buf: memoryview, slots: int, capacity: int):
+    """
+    Typed views into every slot -- (offset, positions, velocities, ids,
+    species).
+    """
+    views = []
+    for i in range(slots):
+        offset = HEADER.size + i * _slot_size(capacity)
+        start = offset + SLOT.size
+        size = capacity * 2 * 8
+        ids = start + 2 * size
+        species = ids + capacity * 8
+        views.append(
+            (
+                offset,
+                buf[start : start + size].cast("d"),
+                buf[start + size : ids].cast("d"),
+                buf[ids:species].cast("Q"),
+                buf[species : species + capacity],
+            )
+        )
+    return views
+
+
+def _release_views(views: list):
+    for offset, positions, velocities, ids, species in views:
+        positions.release()
+        velocities.release()
+        ids.release()
+        species.release()
+
+
+# ------------------------------------------------------------------------ #
+# publisher
+# ------------------------------------------------------------------------ #
+
+
+class StatePublisher:
+    """
+    StatePublisher -- publishes boid states into shared memory
+
+    Frames go round robin into a ring of `slots` frames. A slot's sequence
+    is zeroed while it is written and set last, so readers never see a
+    half written frame as valid; the header sequence then points readers at
+    the new frame. The simulation never waits on a reader.
+
+    At most `capacity` boids are published per frame.
+    """
+
+    def __init__(self, name: str, capacity: int, world_size, slots: int = 4):
+        self._name = name
+        self._capacity = capacity
+        self._slots = slots
+        self._sequence = 0
+
+        size = HEADER.size + slots * _slot_size(capacity)
+        try:
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # left behind by a crashed run
+            _stale = shared_memory.SharedMemory(name=name)
+            _stale.close()
+            _stale.unlink()
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+
+        HEADER.pack_into(
+            self._shm.buf,
+            0,
+            MAGIC,
+            VERSION,
+            slots,
+            capacity,
+            world_size[0],
+            world_size[1],
+            0,
+        )
+        self._views = _slot_views(self._shm.buf, slots, capacity)
+
+    def publish(self, frame: int, boids: list):
+        """
+        Copy the boid states into the next slot of the ring.
+        """
+        count = min(len(boids), self._capacity)
+        if count < len(boids):
+            boids = boids[:count]
+
+        self._sequence += 1
+        offset, positions, velocities, ids, species = self._views[
+            self._sequence % self._slots
+        ]
+        buf = self._shm.buf
+
+        # invalidate, fill, then publish the slot
+        SEQUENCE.pack_into(buf, offset, 0)
+        positions[: 2 * count] = array("d", [v for b in boids for v in b._position])
+        velocities[: 2 * count] = array("d", [v for b in boids for v in b._velocity])
+        ids[:count] = array("Q", [b._id for b in boids])
+        species[:count] = array("B", [b._species for b in boids])
+        SLOT.pack_into(buf, offset, self._sequence, frame, count)
+        SEQUENCE.pack_into(buf, _SEQUENCE_OFFSET, self._sequence)
+
+    def get_name(self):
+        return self._shm.name
+
+    def close(self):
+        """
+        Close and remove the shared memory -- attached readers keep their
+        mapping until they close it.
+        """
+        _release_views(self._views)
+        self._views = []
+        self._shm.close()
+        self._shm.unlink()
+
+
+# ------------------------------------------------------------------------ #
+# reader
+# ------------------------------------------------------------------------ #
+
+
+class FeedFrame:
+    """
+    FeedFrame -- one published frame, read in place
+
+    The arrays are views straight into shared memory. The publisher
+    overwrites the slot once it comes round the ring again, so check
+    is_valid() after reading them; release the frame when done.
+    """
+
+    def __init__(self, reader, offset: int, sequence: int, frame: int, count: int):
+        self._reader = reader
+        self._offset = offset
+        self._sequence = sequence
+        self._frame = frame
+        self._count = count
+
+        _, positions, velocities, ids, species = reader._views[sequence % reader._slots]
+        self._positions = positions[: 2 * count]
+        self._velocities = velocities[: 2 * count]
+        self._ids = ids[:count]
+        self._species = species[:count]
+
+    def is_valid(self):
+        """
+        True if the publisher has not started overwriting this frame.
+        """
+        return self._reader._read_slot_sequence(self._offset) == self._sequence
+
+    def release(self):
+        self._positions.release()
+        self._velocities.release()
+        self._ids.release()
+        self._species.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+
+class FeedReader:
+    """
+    FeedReader -- attaches to a StatePublisher from another process
+
+    Reading never copies and never blocks the publisher. Release every
+    frame before closing the reader.
+    """
+
+    def __init__(self, name: str):
+        self._shm = shared_memory.SharedMemory(name=name)
+        # the publisher owns the memory -- don't let our tracker unlink it
+        if os.name == "posix":
+            resource_tracker.unregister(self._shm._name, "shared_memory")
+
+        (
+            magic,
+            version,
+            self._slots,
+            self._capacity,
+            width,
+            height,
+            _,
+        ) = HEADER.unpack_from(self._shm.buf, 0)
+        if magic != MAGIC or version != VERSION:
+            self._shm.close()
+            raise ValueError(f"{name} is not a version {VERSION} boid feed")
+        self._world_size = (width, height)
+        self._views = _slot_views(self._shm.buf, self._slots, self._capacity)
+
+    def _read_slot_sequence(self, offset: int):
+        return SEQUENCE.unpack_from(self._shm.buf, offset)[0]
+
+    def get_sequence(self):
+        """
+        Sequence of the latest published frame (0 = nothing published yet).
+        """
+        return SEQUENCE.unpack_from(self._shm.buf, _SEQUENCE_OFFSET)[0]
+
+    def get_world_size(self):
+        return self._world_size
+
+    def latest(self):
+        """
+        The latest complete frame, or None if there is none yet.
+        """
+        while True:
+            sequence = self.get_sequence()
+            if sequence == 0:
+                return None
+
+            offset = self._views[sequence % self._slots][0]
+            slot_sequence, frame, count = SLOT.unpack_from(self._shm.buf, offset)
+            if slot_sequence == sequence:
+                return FeedFrame(self, offset, sequence, frame, count)
+            # lapped by the publisher while looking -- try the newer frame
+
+    def close(self):
+        _release_views(self._views)
+        self._views = []
+        self._shm.close()
@@ -0,0 +1,195 @@
+import math
+from array import array
+
+import pygame
+
+# ------------------------------------------------------------------------ #
+# flow field
+# ------------------------------------------------------------------------ #
+
+
+class FlowField:
+    """
+    FlowField -- precomputed steering from attractors + repellers
+
+    The world is covered by a coarse grid of vectors. Every source is
+    rasterized into the grid once, and only again when the sources change;
+    boids then just bilinearly sample the grid, so the per-boid cost does not
+    depend on how many sources there are.
+
+    A source
+    - has a position
+    - has a strength (positive pulls boids in, negative pushes them away)
+    - has a radius of influence
+    """
+
+    def __init__(self, world_area: pygame.FRect, cell_size: float = 48):
+        self._world_area = world_area
+        self._cell_size = cell_size
+
+        # grid points sit on the cell corners
+        self._cols = int(math.ceil(world_area.width / cell_size)) + 1
+        self._rows = int(math.ceil(world_area.height / cell_size)) + 1
+        self._x = array("d", [0.0]) * (self._cols * self._rows)
+        self._y = array("d", [0.0]) * (self._cols * self._rows)
+
+        self._sources = []
+        self._dirty = False
+
+    # ---------------------------------------------------- #
+    # sources
+    # ---------------------------------------------------- #
+
+    def add_source(self, position, strength: float, radius: float):
+        """
+        Add an attractor (strength > 0) or repeller (strength < 0).
+        """
+        self._sources.append((pygame.Vector2(position), strength, radius))
+        self._dirty = True
+
+    def clear(self):
+        """
+        Remove every source.
+        """
+        self._sources = []
+        self._dirty = True
+
+    def has_sources(self):
+        return len(self._sources) > 0
+
+    def rebuild(self):
+        """
+        Rasterize the sources into the grid -- a no-op unless they changed.
+        """
+        if not self._dirty:
+            return
+        self._dirty = False
+
+        for i in range(len(self._x)):
+            self._x[i] = 0.0
+            self._y[i] = 0.0
+
+        x0, y0 = self._world_area.topleft
+        for position, strength, radius in self._sources:
+            # only touch the grid points inside the source radius
+            c0 = max(0, int((position.x - radius - x0) // self._cell_size))
+            c1 = min(
+                self._cols - 1, int((position.x + radius - x0) // self._cell_size) + 1
+            )
+            r0 = max(0, int((position.y - radius - y0) // self._cell_size))
+            r1 = min(
+                self._rows - 1, int((position.y + radius - y0) // self._cell_size) + 1
+            )
+
+            for row in range(r0, r1 + 1):
+                gy = y0 + row * self._cell_size
+                for col in range(c0, c1 + 1):
+                    gx = x0 + col * self._cell_size
+                    dx = position.x - gx
+                    dy = position.y - gy
+                    distance = math.hypot(dx, dy)
+                    if distance == 0 or distance >= radius:
+                        continue
+
+                    # unit direction to the source, fading out at the radius
+                    weight = strength * (1 - distance / radius) / distance
+                    self._x[row * self._cols + col] += dx * weight
+                    self._y[row * self._cols + col] += dy * weight
+
+    # ---------------------------------------------------- #
+    # sampling
+    # ---------------------------------------------------- #
+
+    def sample(self, position):
+        """
+        Bilinearly interpolate the field at a single position.
+        """
+        return self.sample_batch([position])[0]
+
+    def sample_batch(self, positions: list):
+        """
+        Bilinearly interpolate the field for a whole list of positions.
+        """
+        self.rebuild()
+
+        # locals for the hot loop
+        xs = self._x
+        ys = self._y
+        cols = self._cols
+        max_col = self._cols - 2
+        max_row = self._rows - 2
+        x0, y0 = self._world_area.topleft
+        inv_cell = 1 / self._cell_size
+
+        result = []
+        for position in positions:
+            fx = (position[0] - x0) * inv_cell
+            fy = (position[1] - y0) * inv_cell
+            col = min(max(int(fx), 0), max_col)
+            row = min(max(int(fy), 0), max_row)
+            tx = min(max(fx - col, 0.0), 1.0)
+            ty = min(max(fy - row, 0.0), 1.0)
+
+            i = row * cols + col
+            w00 = (1 - tx) * (1 - ty)
+            w10 = tx * (1 - ty)
+            w01 = (1 - tx) * ty
+            w11 = tx * ty
+            result.append(
+                pygame.Vector2(
+                    xs[i] * w00
+                    + xs[i + 1] * w10
+                    + xs[i + cols] * w01
+                    + xs[i + cols + 1] * w11,
+                    ys[i] * w00
+                    + ys[i + 1] * w10
+                    + ys[i + cols] * w01
+                    + ys[i + cols + 1] * w11,
+                )
+            )
+        return result
+
+    # ---------------------------------------------------- #
+    # drawing
+    # ---------------------------------------------------- #
+
+    def draw(self, surface, draw_vectors: bool = False, camera=None):
+        """
+        Draw the sources, and the grid vectors if requested -- through a
+        camera, only the grid points in its view.
+        """
+        scale = camera.get_scale() if camera is not None else 1
+        for position, strength, radius in self._sources:
+            color = (0, 255, 120) if strength > 0 else (255, 80, 80)
+            if camera is not None:
+                position = camera.world_to_screen(position)
+            pygame.draw.circle(surface, color, position, 6)
+            pygame.draw.circle(surface, color, position, radius * scale, width=1)
+
+        if not draw_vectors:
+            return
+
+        self.rebuild()
+        x0, y0 = self._world_area.topleft
+        c0, c1, r0, r1 = 0, self._cols - 1, 0, self._rows - 1
+        if camera is not None:
+            view = camera.get_view()
+            c0 = max(c0, int((view.left - x0) // self._cell_size))
+            c1 = min(c1, int((view.right - x0) // self._cell_size) + 1)
+            r0 = max(r0, int((view.top - y0) // self._cell_size))
+            r1 = min(r1, int((view.bottom - y0) // self._cell_size) + 1)
+
+        for row in range(r0, r1 + 1):
+            for col in range(c0, c1 + 1):
+                vx = self._x[row * self._cols + col]
+                vy = self._y[row * self._cols + col]
+                if vx == 0 and vy == 0:
+                    continue
+                start = pygame.Vector2(
+                    x0 + col * self._cell_size, y0 + row * self._cell_size
+                )
+                end = start + pygame.Vector2(vx, vy).normalize() * self._cell_size * 0.4
+                if camera is not None:
+                    start = camera.world_to_screen(start)
+                    end = camera.world_to_screen(end)
+                pygame.draw.line(surface, (200, 200, 200), start, end, width=1)
@@ -0,0 +1,122 @@
+import pygame
+
+from source import bvh
+
+# ------------------------------------------------------------------------ #
+# flocking rules
+# ------------------------------------------------------------------------ #
+#
+# shared by the simulation in main.py and the domain workers, so both fly
+# by exactly the same rules
+#
+
+
+def accumulate_neighbors(boid, neighbors, world_size=None):
+    """
+    Sum up the separation, alignment and cohesion contributions of `neighbors`.
+
+    Pass the `world_size` of a periodic world to use minimum image
+    displacements. Returns (push, steer, cohesion, count).
+    """
+
+    # factors
+    _steer_factor = boid._velocity.copy()
+    _push_factor = pygame.Vector2(0, 0)
+    _cohesion_factor = pygame.Vector2(0, 0)
+    _nearby_boids = 0
+    _periodic = world_size is not None
+
+    for _other_boid in neighbors:
+        _displacement = _other_boid._position - boid._position
+        if _periodic:
+            # nearest image across the wrapped edges
+            _displacement = bvh.minimum_image(_displacement, world_size)
+        _displacement_length = _displacement.length()
+
+        # push factor - avoid others
+        if _displacement_length > 0:
+            _push_factor += _displacement / _displacement_length**2 * 10
+        # steer factor - follow others directions
+        _steer_factor += _other_boid._velocity
+        # cohesion factor - average of neighbors
+        if _periodic:
+            _cohesion_factor += boid._position + _displacement
+        else:
+            _cohesion_factor += _other_boid._position
+
+        _nearby_boids += 1
+
+    return _push_factor, _steer_factor, _cohesion_factor, _nearby_boids
+
+
+def apply_flocking(
+    boid,
+    push_factor: pygame.Vector2,
+    steer_factor: pygame.Vector2,
+    cohesion_factor: pygame.Vector2,
+    nearby_boids: int,
+    constants: dict,
+):
+    """
+    Turn the accumulated neighbor sums into the boid's acceleration.
+    """
+    if nearby_boids == 0:
+        return
+
+    # step 1: calculate push factor
+    if push_factor.length() > 0:
+        push_factor *= -1
+
+    # step 2: calculate steer factor
+    if steer_factor.length() > 0:
+        steer_factor /= nearby_boids
+        steer_factor = steer_factor.normalize() * nearby_boids
+
+    # step 3: calculate cohesion factor
+    boid._cohesion_point = cohesion_factor.copy()
+    if cohesion_factor.length() > 0:
+        cohesion_factor /= nearby_boids
+        cohesion_factor = cohesion_factor - boid._position
+
+        cohesion_factor.normalize_ip()
+
+    # finalize acceleration
+    boid._push = push_factor * constants["push_factor"] * constants["enable_push"]
+    boid._steer = steer_factor * constants["steer_factor"] * constants["enable_steer"]
+    boid._cohesion = (
+        cohesion_factor * constants["cohesion_factor"] * constants["enable_cohesion"]
+    )
+    boid._acceleration.xy = boid._push + boid._steer + boid._cohesion
+
+
+# ------------------------------------------------------------------------ #
+# integration
+# ------------------------------------------------------------------------ #
+
+
+def integrate(boid, delta: float, speed_range, world_size, jitter: float = 0):
+    """
+    Clamp the speed, move the boid, rotate it by `jitter` degrees and wrap
+    it around the world edges.
+    """
+    # keep boid velocity in a certain range
+    if boid._velocity.length() < speed_range[0]:
+        boid._velocity = boid._velocity.normalize() * speed_range[0]
+    if boid._velocity.length() > speed_range[1] + speed_range[0]:
+        boid._velocity = boid._velocity.normalize() * (speed_range[1] + speed_range[0])
+
+    # move boid
+    boid._position += boid._velocity * delta
+    boid._velocity += (boid._acceleration + boid._avoid) * delta
+    if jitter:
+        boid._velocity.rotate_ip(jitter)
+
+    # check if out of bounds
+    if boid._position.x < 0:
+        boid._position.x = world_size[0]
+    if boid._position.x > world_size[0]:
+        boid._position.x = 0
+    if boid._position.y < 0:
+        boid._position.y = world_size[1]
+    if boid._position.y > world_size[1]:
+        boid._position.y = 0
@@ -0,0 +1,252 @@
+import hashlib
+import json
+import os
+import pickle
+
+import pygame
+
+from source import bvh
+
+# bump when the pickled bvh layout changes so stale caches are ignored
+CACHE_VERSION = 3
+
+# ------------------------------------------------------------------------ #
+# obstacle
+# ------------------------------------------------------------------------ #
+
+
+class Obstacle:
+    """
+    Obstacle -- a static piece of world geometry
+
+    A polyline (walls) or polygon (rects, polygons). Boids never move it, so
+    it lives in its own BVH that is only built once.
+
+    The obstacle
+    - has a list of points
+    - is closed (polygon) or open (wall)
+    - has a bounding area
+    - has a position (centroid) so it can be partitioned like a boid
+    """
+
+    def __init__(self, points: list, closed: bool = True):
+        self._points = [pygame.Vector2(p) for p in points]
+        self._closed = closed
+
+        # centroid + zero velocity -- keeps the bvh aggregates happy
+        self._position = sum(self._points, pygame.Vector2()) / len(self._points)
+        self._velocity = pygame.Vector2()
+        # category bit for the bvh species masks
+        self._species = 0
+
+        xs = [p.x for p in self._points]
+        ys = [p.y for p in self._points]
+        self._bounding_area = pygame.FRect(
+            min(xs), min(ys), max(xs) - min(xs), max(ys) - min(ys)
+        )
+
+    def iterate_edges(self):
+        """Yield every edge as a pair of points."""
+        for i in range(len(self._points) - 1):
+            yield self._points[i], self._points[i + 1]
+        if self._closed and len(self._points) > 2:
+            yield self._points[-1], self._points[0]
+
+    def closest_point(self, point: pygame.Vector2):
+        """Return the closest point on the obstacle's outline to `point`."""
+        best = None
+        best_distance = float("inf")
+        for a, b in self.iterate_edges():
+            edge = b - a
+            length_sq = edge.length_squared()
+            t = 0 if length_sq == 0 else (point - a).dot(edge) / length_sq
+            candidate = a + edge * max(0, min(1, t))
+            distance = (candidate - point).length_squared()
+            if distance < best_distance:
+                best = candidate
+                best_distance = distance
+        return best
+
+    def contains(self, point: pygame.Vector2):
+        """Whether `point` is inside the obstacle (never for open walls)."""
+        if not self._closed or not self._bounding_area.collidepoint(point):
+            return False
+        # even-odd rule -- count the edges a ray to the right crosses
+        inside = False
+        for a, b in self.iterate_edges():
+            if (a.y > point.y) != (b.y > point.y):
+                x = a.x + (point.y - a.y) / (b.y - a.y) * (b.x - a.x)
+                if point.x < x:
+                    inside = not inside
+        return inside
+
+    def draw(self, surface, color: tuple, camera=None):
+        """Draw the outline of the obstacle."""
+        points = self._points
+        width = 2
+        if camera is not None:
+            points = [camera.world_to_screen(point) for point in points]
+            width = max(1, round(2 * camera.get_scale()))
+        pygame.draw.lines(surface, color, self._closed, points, width=width)
+
+
+# ------------------------------------------------------------------------ #
+# obstacle layer
+# ------------------------------------------------------------------------ #
+
+
+class ObstacleLayer:
+    """
+    Static geometry indexed by its own BVH.
+
+    The BVH is built once when the layer is loaded and pickled to
+    `cache_dir`, keyed by a hash of the geometry + bvh settings, so later
+    runs with the same file skip the build completely.
+
+    File format (json):
+        {
+            "rects": [[x, y, w, h], ...],
+            "polygons": [[[x, y], [x, y], ...], ...],
+            "walls": [[[x, y], [x, y], ...], ...]
+        }
+    """
+
+    def __init__(
+        self,
+        geometry: dict,
+        world_area: pygame.FRect,
+        max_depth: int = 3,
+        cache_dir: str = None,
+    ):
+        self._geometry = geometry
+        self._world_area = world_area
+        self._max_depth = max_depth
+
+        self._hash = hashlib.sha1(
+            json.dumps(
+                {
+                    "geometry": geometry,
+                    "world_area": list(world_area),
+                    "max_depth": max_depth,
+                    "version": CACHE_VERSION,
+                },
+                sort_keys=True,
+            ).encode()
+        ).hexdigest()
+
+        self._bvh = self._load_cached(cache_dir)
+        if self._bvh is None:
+            self._bvh = bvh.BVHContainer2D(
+                world_area=world_area,
+                objects=self.create_obstacles(geometry),
+                max_depth=max_depth,
+                extended_objects=True,
+            )
+            self._save_cached(cache_dir)
+
+        self._obstacles = [
+            o for leaf in self._bvh.get_leaves() for o in leaf.iterate_objects()
+        ]
+
+    @classmethod
+    def load(cls, path: str, world_area: pygame.FRect, **kwargs):
+        """
+        Load an obstacle layer from a json file.
+        """
+        with open(path, "r") as f:
+            geometry = json.load(f)
+        return cls(geometry, world_area, **kwargs)
+
+    @staticmethod
+    def create_obstacles(geometry: dict):
+        """
+        Turn the raw geometry into a list of obstacles.
+        """
+        result = []
+        for x, y, w, h in geometry.get("rects", []):
+            result.append(
+                Obstacle([(x, y), (x + w, y), (x + w, y + h), (x, y + h)], closed=True)
+            )
+        for points in geometry.get("polygons", []):
+            result.append(Obstacle(points, closed=True))
+        for points in geometry.get("walls", []):
+            result.append(Obstacle(points, closed=False))
+        return result
+
+    # ---------------------------------------------------- #
+    # cache
+    # ---------------------------------------------------- #
+
+    def get_cache_path(self, cache_dir: str):
+        return os.path.join(cache_dir, f"obstacles-{self._hash}.pickle")
+
+    def _load_cached(self, cache_dir: str):
+        if cache_dir is None:
+            return None
+        path = self.get_cache_path(cache_dir)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            # broken cache file -- just rebuild
+            return None
+
+    def _save_cached(self, cache_dir: str):
+        if cache_dir is None:
+            return
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(self.get_cache_path(cache_dir), "wb") as f:
+            pickle.dump(self._bvh, f)
+
+    # ---------------------------------------------------- #
+    # queries
+    # ---------------------------------------------------- #
+
+    def get_bvh(self):
+        return self._bvh
+
+    def avoidance(self, position: pygame.Vector2, radius: float):
+        """
+        Return a push away from every obstacle edge within `radius` of
+        `position`, stronger the closer the edge is. A boid that ended up
+        inside a closed obstacle is pushed out through the nearest edge at
+        full strength.
+        """
+        result = pygame.Vector2(0, 0)
+        nodes = self._bvh.get_colliding_nodes(
+            pygame.FRect(
+                position.x - radius, position.y - radius, radius * 2, radius * 2
+            )
+        )
+        for node in nodes:
+            for obstacle in node._objects:
+                closest = obstacle.closest_point(position)
+                away = position - closest
+                distance = away.length()
+                if distance == 0:
+                    continue
+                if obstacle.contains(position):
+                    # away from the edge would be further in
+                    result -= away / distance
+                elif distance < radius:
+                    result += away / distance * (1 - distance / radius)
+        return result
+
+    def draw(self, surface, color: tuple = (120, 160, 255), camera=None):
+        """
+        Draw every obstacle -- through a camera, only the ones in its view.
+        """
+        if camera is None:
+            for obstacle in self._obstacles:
+                obstacle.draw(surface, color)
+            return
+
+        # an obstacle can sit in several leaves
+        drawn = set()
+        for node in self._bvh.get_colliding_nodes(camera.get_view()):
+            for obstacle in node._objects:
+                if id(obstacle) not in drawn:
+                    drawn.add(id(obstacle))
+                    obstacle.draw(surface, color, camera)
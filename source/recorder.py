@@ -0,0 +1,196 @@
+import json
+import queue
+import struct
+import threading
+import zlib
+from array import array
+
+# ------------------------------------------------------------------------ #
+# trajectory format
+# ------------------------------------------------------------------------ #
+#
+# file header (little endian)
+#   magic        8s   b"BOIDTRAJ"
+#   version      I
+#   meta length  I    length of the json metadata that follows
+#
+# then any number of chunks
+#   magic        4s   b"CHNK"
+#   frames       I    frames in the chunk
+#   length       I    compressed payload length
+#   payload      zlib compressed, per frame:
+#       frame    Q
+#       count    Q
+#       ids         count Q
+#       positions   count * 2 doubles
+#       velocities  count * 2 doubles
+#
+# boids are written in storage order, which changes (morton re-sorts,
+# despawns) -- the ids say which boid each slot holds in that frame.
+#
+
+MAGIC = b"BOIDTRAJ"
+VERSION = 2
+HEADER = struct.Struct("<8sII")
+CHUNK = struct.Struct("<4sII")
+FRAME = struct.Struct("<QQ")
+
+
+# ------------------------------------------------------------------------ #
+# recorder
+# ------------------------------------------------------------------------ #
+
+
+class TrajectoryRecorder:
+    """
+    TrajectoryRecorder -- streams boid states to disk
+
+    Every `every`-th frame is packed into flat arrays and gathered into
+    chunks of `chunk_frames` frames. Full chunks go through a bounded queue
+    to a background thread that compresses and writes them, so the frame
+    loop never waits on zlib or the disk. If the writer falls behind and the
+    queue is full, the chunk is dropped (and counted) instead of stalling.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        every: int = 1,
+        chunk_frames: int = 64,
+        queue_size: int = 8,
+        metadata: dict = None,
+    ):
+        self._path = path
+        self._every = max(1, every)
+        self._chunk_frames = chunk_frames
+        self._pending = []
+        self._dropped_frames = 0
+
+        meta = json.dumps(metadata or {}).encode()
+        self._file = open(path, "wb")
+        self._file.write(HEADER.pack(MAGIC, VERSION, len(meta)))
+        self._file.write(meta)
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def record(self, frame: int, boids: list):
+        """
+        Record a frame (only every `every`-th frame is kept).
+        """
+        if frame % self._every != 0:
+            return
+
+        ids = array("Q", [b._id for b in boids])
+        positions = array("d", [v for b in boids for v in b._position])
+        velocities = array("d", [v for b in boids for v in b._velocity])
+        self._pending.append(
+            FRAME.pack(frame, len(boids))
+            + ids.tobytes()
+            + positions.tobytes()
+            + velocities.tobytes()
+        )
+
+        if len(self._pending) >= self._chunk_frames:
+            self._submit()
+
+    def _submit(self):
+        if not self._pending:
+            return
+        try:
+            self._queue.put_nowait(self._pending)
+        except queue.Full:
+            self._dropped_frames += len(self._pending)
+        self._pending = []
+
+    def _run(self):
+        """
+        Writer thread -- compress + write chunks until the None sentinel.
+        """
+        while True:
+            frames = self._queue.get()
+            if frames is None:
+                break
+            payload = zlib.compress(b"".join(frames), 1)
+            self._file.write(CHUNK.pack(b"CHNK", len(frames), len(payload)))
+            self._file.write(payload)
+
+    def get_dropped_frames(self):
+        return self._dropped_frames
+
+    def close(self):
+        """
+        Flush the last partial chunk and wait for the writer to finish.
+        """
+        if self._pending:
+            # the loop is over -- it is fine to block here
+            self._queue.put(self._pending)
+            self._pending = []
+        self._queue.put(None)
+        self._thread.join()
+        self._file.close()
+
+
+# ------------------------------------------------------------------------ #
+# reader
+# ------------------------------------------------------------------------ #
+
+
+class TrajectoryReader:
+    """
+    TrajectoryReader -- replays a recorded trajectory lazily
+
+    Only one chunk is decompressed at a time, so long recordings can be
+    replayed without loading them into memory.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        with open(path, "rb") as f:
+            magic, version, meta_length = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path} is not a version {VERSION} trajectory")
+            self._metadata = json.loads(f.read(meta_length))
+            self._data_offset = f.tell()
+
+    def get_metadata(self):
+        return self._metadata
+
+    def frames(self):
+        """
+        Yield (frame, ids, positions, velocities) for every recorded frame;
+        positions / velocities are flat arrays (x, y, x, y, ...), boid i
+        of the frame is ids[i].
+        """
+        with open(self._path, "rb") as f:
+            f.seek(self._data_offset)
+            while True:
+                header = f.read(CHUNK.size)
+                if len(header) < CHUNK.size:
+                    return
+                magic, frame_count, length = CHUNK.unpack(header)
+                if magic != b"CHNK":
+                    raise ValueError(f"{self._path} has a broken chunk")
+
+                payload = zlib.decompress(f.read(length))
+                offset = 0
+                for i in range(frame_count):
+                    frame, count = FRAME.unpack_from(payload, offset)
+                    offset += FRAME.size
+                    ids = array("Q")
+                    ids.frombytes(payload[offset : offset + count * 8])
+                    offset += count * 8
+                    size = count * 2 * 8
+
+                    positions = array("d")
+                    positions.frombytes(payload[offset : offset + size])
+                    offset += size
+                    velocities = array("d")
+                    velocities.frombytes(payload[offset : offset + size])
+                    offset += size
+
+                    yield frame, ids, positions, velocities
+
+    def __iter__(self):
+        return self.frames()
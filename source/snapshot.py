@@ -0,0 +1,171 @@
+import json
+import mmap
+import struct
+import sys
+from array import array
+
+# ------------------------------------------------------------------------ #
+# snapshot format
+# ------------------------------------------------------------------------ #
+#
+# header (little endian)
+#   magic        8s   b"BOIDSNAP"
+#   version      I
+#   byte order   I    0 = little, 1 = big (of the arrays below)
+#   count        Q    number of boids
+#   frame        Q    frame the snapshot was taken on
+#   main index   Q    slot of the tracked main boid
+#   meta length  I    length of the json block
+#
+# body
+#   json block     {"metadata": {...}, "rng_state": [version, [ints], gauss]}
+#                  -- plain json, so opening a shared snapshot can't run code
+#   zero padding to 8 bytes
+#   positions      count * 2 doubles (x, y, x, y, ...)
+#   velocities     count * 2 doubles
+#   accelerations  count * 2 doubles
+#   species        count bytes
+#
+
+MAGIC = b"BOIDSNAP"
+VERSION = 2
+HEADER = struct.Struct("<8sIIQQQI")
+
+
+def _byte_order():
+    return 0 if sys.byteorder == "little" else 1
+
+
+def _padding(offset: int):
+    return (-offset) % 8
+
+
+# ------------------------------------------------------------------------ #
+# writing
+# ------------------------------------------------------------------------ #
+
+
+def write_snapshot(
+    path: str,
+    boids: list,
+    metadata: dict,
+    rng_state,
+    frame: int = 0,
+    main_index: int = 0,
+):
+    """
+    Write the whole flock to `path` in one go.
+
+    Every attribute is packed into its own contiguous array and written with
+    a single call, so saving costs one pass over the boids.
+    """
+    positions = array("d", [v for b in boids for v in b._position])
+    velocities = array("d", [v for b in boids for v in b._velocity])
+    accelerations = array("d", [v for b in boids for v in b._acceleration])
+    species = array("B", [b._species for b in boids])
+
+    # random.Random.getstate() -- (version, tuple of ints, gauss or None)
+    version, internal, gauss = rng_state
+    meta = json.dumps(
+        {"metadata": metadata, "rng_state": [version, list(internal), gauss]}
+    ).encode()
+
+    with open(path, "wb") as f:
+        f.write(
+            HEADER.pack(
+                MAGIC,
+                VERSION,
+                _byte_order(),
+                len(boids),
+                frame,
+                main_index,
+                len(meta),
+            )
+        )
+        f.write(meta)
+        f.write(b"\0" * _padding(HEADER.size + len(meta)))
+
+        positions.tofile(f)
+        velocities.tofile(f)
+        accelerations.tofile(f)
+        species.tofile(f)
+
+
+# ------------------------------------------------------------------------ #
+# reading
+# ------------------------------------------------------------------------ #
+
+
+class Snapshot:
+    """
+    Snapshot -- a memory mapped flock state
+
+    The arrays are memoryviews straight into the mapped file, nothing is
+    parsed per boid. Keep the snapshot open while reading them and close it
+    afterwards.
+    """
+
+    def __init__(self, path: str):
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = view = memoryview(self._mmap)
+
+        (
+            magic,
+            version,
+            byte_order,
+            self._count,
+            self._frame,
+            self._main_index,
+            meta_length,
+        ) = HEADER.unpack_from(view, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a version {VERSION} boid snapshot")
+        if byte_order != _byte_order():
+            self.close()
+            raise ValueError(f"{path} was written on a machine of another byte order")
+
+        offset = HEADER.size
+        meta = json.loads(bytes(view[offset : offset + meta_length]))
+        self._metadata = meta["metadata"]
+        version, internal, gauss = meta["rng_state"]
+        self._rng_state = (version, tuple(internal), gauss)
+        offset += meta_length
+        offset += _padding(offset)
+
+        size = self._count * 2 * 8
+        self._positions = view[offset : offset + size].cast("d")
+        offset += size
+        self._velocities = view[offset : offset + size].cast("d")
+        offset += size
+        self._accelerations = view[offset : offset + size].cast("d")
+        offset += size
+        self._species = view[offset : offset + self._count]
+
+    def close(self):
+        # every view into the map has to go before the map can close
+        for name in (
+            "_positions",
+            "_velocities",
+            "_accelerations",
+            "_species",
+            "_view",
+        ):
+            if hasattr(self, name):
+                getattr(self, name).release()
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def read_snapshot(path: str):
+    """
+    Memory map a snapshot written by write_snapshot.
+    """
+    return Snapshot(path)
@@ -0,0 +1,441 @@
+import asyncio
+import json
+import math
+import queue
+import struct
+import threading
+import zlib
+from array import array
+
+# ------------------------------------------------------------------------ #
+# protocol
+# ------------------------------------------------------------------------ #
+#
+# client -> server: one json object per line
+#   {"cmd": "set", "key": "push_factor", "value": 1.5}
+#   {"cmd": "pause"} / {"cmd": "resume"} / {"cmd": "reset"}
+#   {"cmd": "spawn", "count": 100} / {"cmd": "despawn", "count": 100}
+#   {"cmd": "subscribe", "state": true, "metrics": true}
+#
+# server -> client: framed messages (little endian)
+#   kind         c    H hello, R reply, M metrics, K keyframe, D delta
+#   length       I
+#   payload      json for H / R / M, otherwise
+#       frame    Q
+#       base     Q    frame the delta applies to (= frame for keyframes)
+#       count    Q
+#       zlib compressed body
+#           K: ids (count I), positions (2 * count H), velocities (2 * count H)
+#           D: position deltas, velocity deltas (2 * count H each, mod 2^16)
+#
+# positions are quantized to 16 bits over the world size, velocities to
+# signed 16 bits over +-velocity range, clamped at the ends (both sent in the
+# hello message).
+#
+
+VERSION = 1
+MESSAGE = struct.Struct("<cI")
+STATE = struct.Struct("<QQQ")
+
+
+def _frame_message(kind: bytes, payload: bytes):
+    return MESSAGE.pack(kind, len(payload)) + payload
+
+
+def _json_message(kind: bytes, data: dict):
+    return _frame_message(kind, json.dumps(data).encode())
+
+
+def _to_number(value):
+    """
+    `value` as a finite float (booleans count as 0 / 1), None if it isn't one.
+    """
+    if not isinstance(value, (bool, int, float)):
+        return None
+    value = float(value)
+    return value if math.isfinite(value) else None
+
+
+async def read_message(reader: asyncio.StreamReader):
+    """
+    Read one server message -- returns (kind, payload), json already
+    decoded for H / R / M.
+    """
+    kind, length = MESSAGE.unpack(await reader.readexactly(MESSAGE.size))
+    payload = await reader.readexactly(length)
+    if kind in (b"H", b"R", b"M"):
+        return kind, json.loads(payload)
+    return kind, payload
+
+
+# ------------------------------------------------------------------------ #
+# state encoding
+# ------------------------------------------------------------------------ #
+
+
+class StateEncoder:
+    """
+    StateEncoder -- quantizes boid states and delta encodes them against
+    the previous frame
+
+    A delta is only possible while the boid order is unchanged (no spawns,
+    despawns or morton re-sorts in between); otherwise only a keyframe is
+    produced.
+    """
+
+    def __init__(self, world_size, velocity_range: float):
+        self._position_scale = (65535 / world_size[0], 65535 / world_size[1])
+        self._velocity_scale = 32767 / velocity_range
+
+        self._frame = None
+        self._ids = None
+        self._positions = None
+        self._velocities = None
+
+    def encode(self, frame: int, boids: list):
+        """
+        Quantize a frame -- returns its delta message against the previous
+        frame, or None if the previous frame can't be used as a base.
+        """
+        sx, sy = self._position_scale
+        vs = self._velocity_scale
+        ids = array("I", [b._id for b in boids])
+        positions = array(
+            "H",
+            [
+                v
+                for b in boids
+                for v in (
+                    int(b._position.x * sx) & 0xFFFF,
+                    int(b._position.y * sy) & 0xFFFF,
+                )
+            ],
+        )
+        # clamped, anything past the range would wrap into the other sign
+        velocities = array(
+            "H",
+            [
+                max(-32767, min(32767, int(v * vs))) & 0xFFFF
+                for b in boids
+                for v in b._velocity
+            ],
+        )
+
+        delta = None
+        if self._ids == ids:
+            body = array(
+                "H", [(c - p) & 0xFFFF for c, p in zip(positions, self._positions)]
+            )
+            body.extend((c - p) & 0xFFFF for c, p in zip(velocities, self._velocities))
+            delta = _frame_message(
+                b"D",
+                STATE.pack(frame, self._frame, len(boids))
+                + zlib.compress(body.tobytes(), 1),
+            )
+
+        self._frame = frame
+        self._ids = ids
+        self._positions = positions
+        self._velocities = velocities
+        return delta
+
+    def get_keyframe(self):
+        """
+        Keyframe message for the last encoded frame.
+        """
+        return _frame_message(
+            b"K",
+            STATE.pack(self._frame, self._frame, len(self._ids))
+            + zlib.compress(
+                self._ids.tobytes()
+                + self._positions.tobytes()
+                + self._velocities.tobytes(),
+                1,
+            ),
+        )
+
+    def get_frame(self):
+        return self._frame
+
+
+class StateDecoder:
+    """
+    StateDecoder -- client side of StateEncoder
+    """
+
+    def __init__(self, world_size, velocity_range: float):
+        self._position_scale = (world_size[0] / 65535, world_size[1] / 65535)
+        self._velocity_scale = velocity_range / 32767
+
+        self._frame = None
+        self._ids = None
+        self._positions = None
+        self._velocities = None
+
+    def decode(self, kind: bytes, payload: bytes):
+        """
+        Apply a K / D message, returns (frame, ids, positions, velocities)
+        with flat float lists (x, y, x, y, ...).
+        """
+        frame, base, count = STATE.unpack_from(payload)
+        body = zlib.decompress(payload[STATE.size :])
+
+        if kind == b"K":
+            self._ids = array("I", body[: count * 4])
+            self._positions = array("H", body[count * 4 : count * 8])
+            self._velocities = array("H", body[count * 8 :])
+        elif kind == b"D":
+            if base != self._frame or count != len(self._ids):
+                raise ValueError(f"delta for frame {base}, have {self._frame}")
+            deltas = array("H", body)
+            self._positions = array(
+                "H",
+                [(p + d) & 0xFFFF for p, d in zip(self._positions, deltas)],
+            )
+            self._velocities = array(
+                "H",
+                [
+                    (v + d) & 0xFFFF
+                    for v, d in zip(self._velocities, deltas[2 * count :])
+                ],
+            )
+        else:
+            raise ValueError(f"not a state message: {kind}")
+        self._frame = frame
+
+        sx, sy = self._position_scale
+        vs = self._velocity_scale
+        positions = [
+            p * (sx if i % 2 == 0 else sy) for i, p in enumerate(self._positions)
+        ]
+        velocities = [(v - 65536 if v > 32767 else v) * vs for v in self._velocities]
+        return frame, list(self._ids), positions, velocities
+
+
+# ------------------------------------------------------------------------ #
+# server
+# ------------------------------------------------------------------------ #
+
+
+class _Client:
+    def __init__(self, writer: asyncio.StreamWriter, queue_size: int):
+        self._writer = writer
+        self._queue = asyncio.Queue(maxsize=queue_size)
+        self._state = False
+        self._metrics = False
+        # last state frame queued for this client (delta base)
+        self._frame = None
+        self._dropped_frames = 0
+
+    def offer(self, message: bytes):
+        """
+        Queue a message unless the client is behind -- returns False if it
+        was dropped.
+        """
+        try:
+            self._queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            self._dropped_frames += 1
+            return False
+
+
+class TelemetryServer:
+    """
+    TelemetryServer -- control + state streaming over tcp
+
+    The asyncio loop runs on a background thread. Commands from clients are
+    queued and picked up by the simulation with poll_commands(), so the
+    simulation state is only ever touched by its own thread. publish()
+    encodes a frame once and hands it to every subscriber -- as a delta to
+    clients that got the previous frame, a full keyframe is only built when
+    someone needs one. Each client has a small bounded queue, and a client
+    that can't keep up has frames dropped (and gets a keyframe next)
+    instead of stalling the loop.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        world_size,
+        velocity_range: float,
+        keys,
+        queue_size: int = 4,
+    ):
+        self._host = host
+        self._port = port
+        self._queue_size = queue_size
+        self._keys = set(keys)
+        self._hello = {
+            "version": VERSION,
+            "world_size": list(world_size),
+            "velocity_range": velocity_range,
+            "keys": sorted(self._keys),
+        }
+
+        self._encoder = StateEncoder(world_size, velocity_range)
+        self._commands = queue.Queue()
+        self._clients = []
+
+        self._loop = asyncio.new_event_loop()
+        self._started = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self._started.wait()
+
+    # ---------------------------------------------------- #
+    # background thread
+    # ---------------------------------------------------- #
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        self._server = self._loop.run_until_complete(
+            asyncio.start_server(self._handle_client, self._host, self._port)
+        )
+        # port 0 picks a free one
+        self._port = self._server.sockets[0].getsockname()[1]
+        self._started.set()
+        self._loop.run_forever()
+        self._loop.close()
+
+    async def _shutdown(self):
+        self._server.close()
+        for client in list(self._clients):
+            client._writer.close()
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _handle_client(self, reader, writer):
+        client = _Client(writer, self._queue_size)
+        self._clients.append(client)
+        # hello + replies skip the frame queue, they must not be dropped
+        writer.write(_json_message(b"H", self._hello))
+        sender = asyncio.create_task(self._send(client))
+        try:
+            while line := await reader.readline():
+                reply = self._handle_command(client, line)
+                writer.write(_json_message(b"R", reply))
+        except ConnectionError:
+            pass
+        finally:
+            self._clients.remove(client)
+            sender.cancel()
+            writer.close()
+
+    async def _send(self, client: _Client):
+        try:
+            while True:
+                message = await client._queue.get()
+                client._writer.write(message)
+                # back-pressure from the socket -- the queue fills meanwhile
+                await client._writer.drain()
+        except ConnectionError:
+            pass
+
+    def _handle_command(self, client: _Client, line: bytes):
+        try:
+            command = json.loads(line)
+            cmd = command["cmd"]
+        except (ValueError, KeyError, TypeError):
+            return {"ok": False, "error": "expected a json object with a cmd"}
+
+        if cmd == "subscribe":
+            client._state = bool(command.get("state", True))
+            client._metrics = bool(command.get("metrics", False))
+            client._frame = None
+            return {"ok": True, "cmd": cmd}
+        if cmd not in ("set", "pause", "resume", "reset", "spawn", "despawn"):
+            return {"ok": False, "error": f"unknown cmd {cmd}"}
+
+        # the simulation thread trusts what it gets -- coerce values here
+        if cmd == "set":
+            if command.get("key") not in self._keys:
+                return {"ok": False, "error": f"unknown key {command.get('key')}"}
+            value = _to_number(command.get("value"))
+            if value is None:
+                return {"ok": False, "error": "value must be a finite number"}
+            command = {"cmd": cmd, "key": command["key"], "value": value}
+        elif cmd in ("spawn", "despawn"):
+            count = _to_number(command.get("count", 100))
+            if count is None or count < 0 or count != int(count):
+                return {"ok": False, "error": "count must be a whole number >= 0"}
+            command = {"cmd": cmd, "count": int(count)}
+
+        self._commands.put(command)
+        return {"ok": True, "cmd": cmd}
+
+    def _broadcast(self, frame, keyframe, delta, base, metrics):
+        for client in self._clients:
+            if client._metrics and metrics is not None:
+                client.offer(metrics)
+            if not client._state or frame is None:
+                continue
+
+            message = delta if delta is not None and client._frame == base else keyframe
+            if message is not None and client.offer(message):
+                client._frame = frame
+            else:
+                # the next frame can't be a delta against what it missed
+                client._frame = None
+
+    # ---------------------------------------------------- #
+    # simulation thread
+    # ---------------------------------------------------- #
+
+    def get_port(self):
+        return self._port
+
+    def poll_commands(self):
+        """
+        Every command received since the last call.
+        """
+        commands = []
+        while True:
+            try:
+                commands.append(self._commands.get_nowait())
+            except queue.Empty:
+                return commands
+
+    def publish(self, frame: int, boids: list, metrics: dict = None):
+        """
+        Stream a frame (and metrics) to the subscribed clients -- nothing
+        is encoded if nobody is listening.
+        """
+        subscribers = [client for client in self._clients if client._state]
+        keyframe = delta = base = None
+        if subscribers:
+            base = self._encoder.get_frame()
+            delta = self._encoder.encode(frame, boids)
+            # a client that missed a frame (or just subscribed) needs a full one
+            if delta is None or any(client._frame != base for client in subscribers):
+                keyframe = self._encoder.get_keyframe()
+
+        if metrics is not None and any(client._metrics for client in self._clients):
+            metrics = _json_message(b"M", {"frame": frame, **metrics})
+        else:
+            metrics = None
+
+        if not subscribers and metrics is None:
+            return
+        self._loop.call_soon_threadsafe(
+            self._broadcast,
+            frame if subscribers else None,
+            keyframe,
+            delta,
+            base,
+            metrics,
+        )
+
+    def get_dropped_frames(self):
+        return sum(client._dropped_frames for client in list(self._clients))
+
+    def close(self):
+        """
+        Disconnect every client and stop the background thread.
+        """
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
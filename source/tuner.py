@@ -0,0 +1,180 @@
+import statistics
+
+# ------------------------------------------------------------------------ #
+# broadphase tuner
+# ------------------------------------------------------------------------ #
+#
+# the best bvh depth depends on the population, the world size and the
+# detection radius -- too shallow and every query scans crowded leaves, too
+# deep and the build + traversal overhead wins. the tuner times frames and
+# hill climbs over the choices
+#   BRUTE_FORCE, 1, 2, ..., max_depth
+# (brute force sits below depth 1 -- a depth 0 tree is one leaf anyway).
+#
+# a round starts from the current choice, measures it over a window of
+# frames, then its neighbors, and keeps walking towards the cheaper side
+# until neither neighbor is cheaper. a round is only started when the
+# population or the detection radius moved by more than `retune_change`,
+# and the winner only replaces the current choice if it is cheaper by more
+# than `tolerance` -- so noise doesn't flip it back and forth.
+#
+
+BRUTE_FORCE = 0
+
+
+class BroadphaseTuner:
+    """
+    BroadphaseTuner -- picks the bvh depth (or brute force) at runtime
+
+    Feed it the simulation cost of every frame with update(), and use the
+    choice it returns for the next frame.
+    """
+
+    def __init__(
+        self,
+        depth: int = 4,
+        min_depth: int = 1,
+        max_depth: int = 8,
+        window: int = 20,
+        warmup: int = 2,
+        tolerance: float = 0.1,
+        retune_change: float = 0.2,
+    ):
+        self._min_depth = min_depth
+        self._max_depth = max_depth
+        self._window = window
+        self._warmup = warmup
+        self._tolerance = tolerance
+        self._retune_change = retune_change
+
+        # the choice in use outside of a round
+        self._choice = depth
+        # population + radius the last round started with
+        self._reference = None
+
+        # round state -- median cost per measured choice
+        self._costs = {}
+        self._trial = None
+        self._samples = []
+        self._skip = 0
+        self._lowest = min_depth
+
+    # ---------------------------------------------------- #
+    # rounds
+    # ---------------------------------------------------- #
+
+    def _changed(self, population: int, threshold: float):
+        if self._reference is None:
+            return True
+        for _old, _new in zip(self._reference, (population, threshold)):
+            if abs(_new - _old) > self._retune_change * max(_old, 1):
+                return True
+        return False
+
+    def _start_round(self, population: int, threshold: float):
+        self._reference = (population, threshold)
+        self._costs = {}
+        self._start_trial(self._choice)
+
+    def _start_trial(self, choice: int):
+        self._trial = choice
+        self._samples = []
+        # the first frames after a switch still pay for it
+        self._skip = self._warmup
+
+    def _next_trial(self):
+        """
+        The unmeasured neighbor of the cheapest choice so far, None when the
+        round is done.
+        """
+        best = min(self._costs, key=self._costs.get)
+        for _neighbor in (best - 1, best + 1):
+            if self._lowest <= _neighbor <= self._max_depth:
+                if _neighbor not in self._costs:
+                    return _neighbor
+        return None
+
+    def _finish_round(self):
+        best = min(self._costs, key=self._costs.get)
+        current = self._costs.get(self._choice)
+        if current is None or self._costs[best] < current * (1 - self._tolerance):
+            self._choice = best
+        self._trial = None
+
+    # ---------------------------------------------------- #
+    # per frame
+    # ---------------------------------------------------- #
+
+    def update(
+        self,
+        cost_ms: float,
+        population: int,
+        threshold: float,
+        brute_force: bool = True,
+    ):
+        """
+        Record the cost of the frame that just ran with get_choice(), and
+        return the choice for the next one -- a depth, or BRUTE_FORCE.
+
+        `brute_force` is False while something needs the bvh (leaf pairs,
+        aggregates, ...), brute force is then never picked.
+        """
+        self._lowest = BRUTE_FORCE if brute_force else self._min_depth
+        if self._choice < self._lowest or (
+            self._trial is not None and self._trial < self._lowest
+        ):
+            # brute force was just ruled out -- measure again without it
+            self._choice = max(self._choice, self._min_depth)
+            self._reference = None
+
+        if self._changed(population, threshold):
+            self._start_round(population, threshold)
+            return self.get_choice()
+        if self._trial is None:
+            return self._choice
+
+        if self._skip > 0:
+            self._skip -= 1
+            return self._trial
+        self._samples.append(cost_ms)
+
+        # give up early on a choice that is clearly worse than the best one
+        _cost = statistics.median(self._samples)
+        _best = min(self._costs.values(), default=None)
+        _clearly_worse = (
+            _best is not None
+            and len(self._samples) >= self._window // 4
+            and _cost > _best * 2
+        )
+        if len(self._samples) < self._window and not _clearly_worse:
+            return self._trial
+
+        self._costs[self._trial] = _cost
+        _next = self._next_trial()
+        if _next is None:
+            self._finish_round()
+        else:
+            self._start_trial(_next)
+        return self.get_choice()
+
+    def get_choice(self):
+        """
+        Depth (or BRUTE_FORCE) to use for the next frame.
+        """
+        return self._choice if self._trial is None else self._trial
+
+    def is_tuning(self):
+        return self._trial is not None
+
+    def get_costs(self):
+        """
+        Median frame cost (ms) of every choice measured in the last round.
+        """
+        return dict(self._costs)
+
+    def reset(self):
+        """
+        Forget the measurements -- the next update starts a new round.
+        """
+        self._reference = None
+        self._trial = None
@@ -86,6 +86,9 @@ class UISlider(UIObject):
         self._dragging = False
         self._knob_width = 10  # Width of the slider knob in pixels
         self._update_func = update_func
+        # last value handed to update_func -- only report changes, so values
+        # set elsewhere (e.g. a loaded checkpoint) are not overwritten
+        self._last_value = default_value
 
     def draw(self, surface, ctx):
         """
@@ -131,8 +134,9 @@ class UISlider(UIObject):
         else:
             self._dragging = False
 
-        # Call the update function if provided
-        if self._update_func:
+        # Call the update function if provided and the value changed
+        if self._update_func and self._value != self._last_value:
+            self._last_value = self._value
             self._update_func(self._value)
 
     def get_current_value(self):
@@ -0,0 +1,274 @@
+import argparse
+import ast
+import contextlib
+import csv
+import io
+import itertools
+import math
+import multiprocessing
+import os
+import random
+import runpy
+import sys
+import time
+
+# ------------------------------------------------------------------------ #
+# setup
+# ------------------------------------------------------------------------ #
+
+# run many headless simulations over a grid / random sample of constants, e.g.
+#   python sweep.py --grid push_factor=0.5,1,2 --grid steer_factor=0.5,1
+#   python sweep.py --random cohesion_factor=0.1:2 --samples 32 --frames 600
+W_ARGS_PARSER = argparse.ArgumentParser(description="parameter sweep over boids")
+W_ARGS_PARSER.add_argument(
+    "--grid",
+    action="append",
+    default=[],
+    metavar="KEY=V1,V2,...",
+    help="try every listed value of a constant (all combinations)",
+)
+W_ARGS_PARSER.add_argument(
+    "--random",
+    action="append",
+    default=[],
+    metavar="KEY=LOW:HIGH",
+    help="sample a constant uniformly from a range",
+)
+W_ARGS_PARSER.add_argument(
+    "--samples",
+    type=int,
+    default=16,
+    help="random samples per grid point",
+)
+W_ARGS_PARSER.add_argument(
+    "--set",
+    action="append",
+    default=[],
+    metavar="KEY=VALUE",
+    help="fixed override passed to every run",
+)
+W_ARGS_PARSER.add_argument("--frames", type=int, default=300, help="frames per run")
+W_ARGS_PARSER.add_argument("--seed", type=int, default=0, help="seed of the sweep")
+W_ARGS_PARSER.add_argument(
+    "--workers",
+    type=int,
+    default=os.cpu_count(),
+    help="worker processes (default: one per core)",
+)
+W_ARGS_PARSER.add_argument(
+    "--out",
+    default="sweep.csv",
+    help="results table",
+)
+
+W_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# ------------------------------------------------------------------------ #
+# runs
+# ------------------------------------------------------------------------ #
+
+
+def read_constant_keys():
+    """
+    Keys of BOID_LOGIC_CONSTANTS in main.py -- read from the source, as
+    importing main.py would start a simulation.
+    """
+    with open(os.path.join(W_ROOT, "main.py"), "r") as f:
+        tree = ast.parse(f.read())
+    for node in tree.body:
+        if (
+            isinstance(node, ast.Assign)
+            and isinstance(node.targets[0], ast.Name)
+            and node.targets[0].id == "BOID_LOGIC_CONSTANTS"
+        ):
+            return {key.value for key in node.value.keys}
+    raise RuntimeError("BOID_LOGIC_CONSTANTS not found in main.py")
+
+
+def make_runs(grid: list, ranges: list, samples: int, seed: int):
+    """
+    Every parameter combination to run -- a list of {key: value}.
+    """
+    _rng = random.Random(seed)
+
+    _grid = []
+    for _item in grid:
+        _key, _, _values = _item.partition("=")
+        _grid.append([(_key, float(v)) for v in _values.split(",")])
+
+    _ranges = []
+    for _item in ranges:
+        _key, _, _bounds = _item.partition("=")
+        _low, _, _high = _bounds.partition(":")
+        _ranges.append((_key, float(_low), float(_high)))
+
+    _runs = []
+    for _point in itertools.product(*_grid):
+        for i in range(samples if _ranges else 1):
+            _params = dict(_point)
+            for _key, _low, _high in _ranges:
+                _params[_key] = _rng.uniform(_low, _high)
+            _runs.append(_params)
+    return _runs
+
+
+def measure_flock(world: dict):
+    """
+    Neighbor count, order + cohesion of the final state of a finished run.
+
+    order     -- length of the mean heading (1 = everyone flies the same way)
+    cohesion  -- share of the boids in the largest group of neighbors
+    """
+    _boids = world["_boids_container"]
+    _bvh = world["_bounding_volume_hierarchy"]
+    _constants = world["BOID_LOGIC_CONSTANTS"]
+    _threshold = _constants["distance_threshold"]
+    _periodic = _constants["periodic_boundary"] == 1
+
+    # neighbor graph (exact radius)
+    _slots = {_boid._id: i for i, _boid in enumerate(_boids)}
+    _neighbors = []
+    for _boid in _boids:
+        _list = []
+        for _other in world["iterate_nearby_boids"](_bvh, _boids, _boid):
+            _offset = _other._position - _boid._position
+            if _periodic:
+                _offset = world["_minimum_image"](_offset)
+            if _offset.length_squared() <= _threshold * _threshold:
+                _list.append(_slots[_other._id])
+        _neighbors.append(_list)
+
+    # largest connected group
+    _group = [-1] * len(_boids)
+    _largest = 0
+    for i in range(len(_boids)):
+        if _group[i] != -1:
+            continue
+        _group[i] = i
+        _stack = [i]
+        _size = 0
+        while _stack:
+            j = _stack.pop()
+            _size += 1
+            for k in _neighbors[j]:
+                if _group[k] == -1:
+                    _group[k] = i
+                    _stack.append(k)
+        _largest = max(_largest, _size)
+
+    _heading_x = _heading_y = 0.0
+    for _boid in _boids:
+        if _boid._velocity.length_squared() > 0:
+            _heading = _boid._velocity.normalize()
+            _heading_x += _heading.x
+            _heading_y += _heading.y
+
+    _count = max(1, len(_boids))
+    return {
+        "neighbors": sum(len(_list) for _list in _neighbors) / _count,
+        "order": math.hypot(_heading_x, _heading_y) / _count,
+        "cohesion": _largest / _count,
+    }
+
+
+def run_world(task):
+    """
+    Run main.py headless in this process with the given overrides.
+    """
+    _index, _params, _fixed, _frames, _seed = task
+
+    sys.argv = [
+        "main.py",
+        "--headless",
+        "--fixed-step",
+        "--frames",
+        str(_frames),
+        "--seed",
+        str(_seed),
+    ]
+    for _key, _value in list(_fixed.items()) + list(_params.items()):
+        sys.argv += ["--set", f"{_key}={_value}"]
+
+    _start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            _world = runpy.run_path(os.path.join(W_ROOT, "main.py"))
+    except (SystemExit, Exception) as e:
+        # a dead worker would leave the pool waiting forever -- report it
+        return {"run": _index, "seed": _seed, **_params, "error": repr(e)}
+    _wall = time.perf_counter() - _start
+
+    _boids = len(_world["_boids_container"])
+    # the values the world ran with, not the requested ones
+    _constants = _world["BOID_LOGIC_CONSTANTS"]
+    _applied = {_key: _constants[_key] for _key in list(_fixed) + list(_params)}
+    return {
+        "run": _index,
+        "seed": _seed,
+        **_applied,
+        "boids": _boids,
+        "frames": _world["_frame_total"],
+        "wall_s": _wall,
+        "steps_per_s": _world["_frame_total"] * _boids / _world["_delta_total"],
+        **measure_flock(_world),
+    }
+
+
+def _init_worker():
+    os.chdir(W_ROOT)
+    sys.path.insert(0, W_ROOT)
+    os.environ["SDL_AUDIODRIVER"] = "dummy"
+
+
+# ------------------------------------------------------------------------ #
+# main
+# ------------------------------------------------------------------------ #
+
+if __name__ == "__main__":
+    W_ARGS = W_ARGS_PARSER.parse_args()
+
+    _fixed = {}
+    for _item in W_ARGS.set:
+        _key, _, _value = _item.partition("=")
+        _fixed[_key] = float(_value)
+
+    _runs = make_runs(W_ARGS.grid, W_ARGS.random, W_ARGS.samples, W_ARGS.seed)
+
+    _keys = read_constant_keys()
+    for _key in list(_fixed) + (list(_runs[0]) if _runs else []):
+        if _key not in _keys:
+            W_ARGS_PARSER.error(f"unknown constant {_key}")
+
+    _tasks = [
+        (i, _params, _fixed, W_ARGS.frames, W_ARGS.seed + i)
+        for i, _params in enumerate(_runs)
+    ]
+    _workers = max(1, min(W_ARGS.workers, len(_tasks)))
+    # several worlds per worker, one after another
+    _chunk = max(1, len(_tasks) // (_workers * 4))
+    print(f"{len(_tasks)} runs on {_workers} workers")
+
+    _results = []
+    with multiprocessing.Pool(_workers, initializer=_init_worker) as _pool:
+        for _result in _pool.imap_unordered(run_world, _tasks, chunksize=_chunk):
+            _results.append(_result)
+            if "error" in _result:
+                print(
+                    f"[{len(_results)}/{len(_tasks)}] run {_result['run']} "
+                    f"failed: {_result['error']}"
+                )
+                continue
+            print(
+                f"[{len(_results)}/{len(_tasks)}] run {_result['run']}: "
+                f"{_result['steps_per_s']:.0f} steps/s, "
+                f"order {_result['order']:.2f}, cohesion {_result['cohesion']:.2f}"
+            )
+
+    _results.sort(key=lambda r: r["run"])
+    with open(W_ARGS.out, "w", newline="") as f:
+        # failed runs only have some of the columns (plus "error")
+        _fields = list(dict.fromkeys(k for r in _results for k in r))
+        _writer = csv.DictWriter(f, fieldnames=_fields)
+        _writer.writeheader()
+        _writer.writerows(_results)
+    print(f"wrote {W_ARGS.out}")
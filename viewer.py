@@ -0,0 +1,71 @@
+import argparse
+import colorsys
+
+import pygame
+
+from source import feed
+
+# ------------------------------------------------------------------------ #
+# setup
+# ------------------------------------------------------------------------ #
+
+# a separate window onto a running simulation, e.g.
+#   python main.py --headless --feed boids
+#   python viewer.py boids
+W_ARGS_PARSER = argparse.ArgumentParser(description="view a shared memory boid feed")
+W_ARGS_PARSER.add_argument("name", help="feed name passed to main.py --feed")
+W_ARGS = W_ARGS_PARSER.parse_args()
+
+W_SIZE = [1280, 720]
+W_BACKGROUND_COLOR = (0, 17, 41, 255)
+W_FPS = 60
+
+# same hues as BOID_SPECIES in main.py
+SPECIES_HUES = [0.55, 0.3, 0.0]
+
+# ------------------------------------------------------------------------ #
+# loop
+# ------------------------------------------------------------------------ #
+
+_reader = feed.FeedReader(W_ARGS.name)
+_scale = min(
+    W_SIZE[0] / _reader.get_world_size()[0], W_SIZE[1] / _reader.get_world_size()[1]
+)
+_colors = [
+    tuple(int(c * 255) for c in colorsys.hsv_to_rgb(hue, 1, 1)) for hue in SPECIES_HUES
+]
+
+W_WINDOW = pygame.display.set_mode(W_SIZE)
+W_CLOCK = pygame.time.Clock()
+W_RUNNING = True
+
+while W_RUNNING:
+    for e in pygame.event.get():
+        if e.type == pygame.QUIT:
+            W_RUNNING = False
+
+    W_WINDOW.fill(W_BACKGROUND_COLOR)
+
+    _frame = _reader.latest()
+    if _frame is not None:
+        with _frame:
+            _positions = _frame._positions
+            for i in range(_frame._count):
+                pygame.draw.circle(
+                    W_WINDOW,
+                    _colors[_frame._species[i] % len(_colors)],
+                    (_positions[2 * i] * _scale, _positions[2 * i + 1] * _scale),
+                    2,
+                )
+            if not _frame.is_valid():
+                # the simulation lapped us mid-draw -- show the next one,
+                # still at the frame cap
+                W_CLOCK.tick(W_FPS)
+                continue
+        pygame.display.set_caption(f"boids feed -- frame {_frame._frame}")
+
+    pygame.display.flip()
+    W_CLOCK.tick(W_FPS)
+
+_reader.close()
+pygame.quit()